@@ -1,29 +1,1245 @@
-from flask import Flask, request, render_template, jsonify, send_file
+from flask import Flask, request, render_template, jsonify, send_file, send_from_directory, Response, stream_with_context, redirect
 import os
 import requests
 import re
 from datetime import datetime
-import yt_dlp
-import instaloader
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
+from werkzeug.wsgi import FileWrapper
+from werkzeug.exceptions import HTTPException
+from werkzeug.middleware.proxy_fix import ProxyFix
 import shutil
 import stat
+import threading
+import collections
+import copy
+import uuid
+import time
+import json
+import io
+import socket
+import sys
+import asyncio
+import contextvars
+import sqlite3
+import hashlib
+import subprocess
+import importlib
+import functools
+import abc
+from contextlib import contextmanager
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'b8e5c1fc1e75d3407b64c81eb032d1f432aa87f6eab12da96c7f6723ef4321bc'
+# Let Apache/lighttpd stream files via X-Sendfile instead of Python
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE', '').lower() in ('1', 'true', 'yes')
+# Number of reverse proxies in front of the app; their X-Forwarded-For and
+# X-Forwarded-Proto entries are trusted, anything a client adds before them is not
+TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', 0))
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=TRUSTED_PROXIES)
 
 # Create downloads directory if it doesn't exist
 DOWNLOAD_DIR = os.path.join(os.getcwd(), 'downloads')
 if not os.path.exists(DOWNLOAD_DIR):
     os.makedirs(DOWNLOAD_DIR)
 
+
+def parse_platform_limits(value, defaults, cast=int):
+    """Parse 'youtube=4,instagram=1' into a dict layered over defaults"""
+    limits = dict(defaults)
+    for part in (value or '').split(','):
+        if '=' in part:
+            name, limit = part.split('=', 1)
+            limits[name.strip().lower()] = cast(limit)
+    return limits
+
+
+# Persistent caches (metadata, indexes) live outside DOWNLOAD_DIR so they
+# never show up in /downloads
+CACHE_DIR = os.environ.get('CACHE_DIR', os.path.join(os.getcwd(), 'cache'))
+os.makedirs(CACHE_DIR, exist_ok=True)
+
+# Extracted info dicts carry signed media URLs that expire, so keep the TTL short
+METADATA_CACHE_TTL = int(os.environ.get('METADATA_CACHE_TTL', 1800))
+METADATA_CACHE_SIZE = int(os.environ.get('METADATA_CACHE_SIZE', 1000))
+
+# Idle yt-dlp/instaloader instances kept warm per options profile
+EXTRACTOR_POOL_SIZE = int(os.environ.get('EXTRACTOR_POOL_SIZE', 4))
+# Instaloader session (from `instaloader --login`) loaded once per pooled loader
+INSTAGRAM_USERNAME = os.environ.get('INSTAGRAM_USERNAME', '')
+
+# Parallel connections per file, by platform; direct HTTP formats use aria2c
+# for this when it is installed, fragmented (DASH/HLS) formats use yt-dlp's
+# own concurrent fragment fetching
+PLATFORM_SEGMENTS = parse_platform_limits(os.environ.get('PLATFORM_SEGMENTS'), {
+    'youtube': 4,
+    'twitch': 4,
+    'default': 1,
+})
+# Chunk size for yt-dlp's native HTTP downloader, so a failed request only
+# re-fetches one chunk
+HTTP_CHUNK_SIZE = int(os.environ.get('HTTP_CHUNK_SIZE', 10 * 1024 * 1024))
+ARIA2C = shutil.which('aria2c')
+
+# Per-source archives of media ids already fetched by /sync, when there is
+# no JOB_STORE to keep them in
+SYNC_ARCHIVE_DIR = os.path.join(CACHE_DIR, 'archives')
+os.makedirs(SYNC_ARCHIVE_DIR, exist_ok=True)
+# Most posts a single Instagram profile sync will fetch
+INSTAGRAM_SYNC_LIMIT = int(os.environ.get('INSTAGRAM_SYNC_LIMIT', 50))
+
+# Download starts (and Instagram API queries) per second by platform; 0 = no
+# limit. With a JOB_STORE these tokens, and the backoff below, are shared by
+# all nodes
+PLATFORM_REQUEST_RATE = parse_platform_limits(os.environ.get('PLATFORM_REQUEST_RATE'), {
+    'instagram': 0.5,
+    'default': 0,
+}, cast=float)
+# Aggregate bytes/sec across all transfers of a platform on this node; 0 = no
+# limit. Not shared through JOB_STORE: divide it by the number of worker nodes
+PLATFORM_BANDWIDTH = parse_platform_limits(os.environ.get('PLATFORM_BANDWIDTH'), {'default': 0})
+# Cool-down after a 429 or checkpoint, doubled on each repeat up to the max
+RATE_LIMIT_BACKOFF = int(os.environ.get('RATE_LIMIT_BACKOFF', 60))
+RATE_LIMIT_BACKOFF_MAX = int(os.environ.get('RATE_LIMIT_BACKOFF_MAX', 3600))
+
+# Locally generated listing thumbnails (and optional preview strips)
+THUMBNAIL_DIR = os.path.join(CACHE_DIR, 'thumbnails')
+os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+THUMBNAIL_WIDTH = int(os.environ.get('THUMBNAIL_WIDTH', 320))
+THUMBNAIL_PREVIEWS = os.environ.get('THUMBNAIL_PREVIEWS', '').lower() in ('1', 'true', 'yes')
+THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', 1))
+FFMPEG = shutil.which('ffmpeg')
+
+# Byte quota for DOWNLOAD_DIR (0 = unlimited); least recently used items are
+# evicted down to STORAGE_LOW_WATERMARK of the quota
+STORAGE_QUOTA = int(os.environ.get('STORAGE_QUOTA', 0))
+STORAGE_LOW_WATERMARK = float(os.environ.get('STORAGE_LOW_WATERMARK', 0.9))
+STORAGE_CHECK_INTERVAL = int(os.environ.get('STORAGE_CHECK_INTERVAL', 60))
+
+# Files counted and served as downloaded media (audio-only and original
+# container profiles produce more than mp4)
+MEDIA_EXTENSIONS = ('.mp4', '.m4a', '.webm', '.mkv', '.mp3', '.opus', '.ogg')
+
+# Quality profiles accepted by /download and /bulk-download; each overrides
+# the platform's default format selection
+QUALITY_PROFILES = {
+    'audio': {'format': 'bestaudio[ext=m4a]/bestaudio/best', 'merge_output_format': None},
+    '360p': {'format': 'bestvideo[height<=360]+bestaudio/best[height<=360]/best', 'merge_output_format': 'mp4'},
+    '720p': {'format': 'bestvideo[height<=720]+bestaudio/best[height<=720]/best', 'merge_output_format': 'mp4'},
+    '1080p': {'format': 'bestvideo[height<=1080]+bestaudio/best[height<=1080]/best', 'merge_output_format': 'mp4'},
+    # Best single file as the site serves it: no merge, no re-mux
+    'original': {'format': 'best', 'merge_output_format': None},
+}
+
+# Progress events kept per job for late SSE subscribers, and how often a
+# single transfer may publish one
+PROGRESS_HISTORY = int(os.environ.get('PROGRESS_HISTORY', 200))
+PROGRESS_INTERVAL = float(os.environ.get('PROGRESS_INTERVAL', 0.5))
+
+# Multi-node mode: job store every node can reach. Nodes claim jobs from it,
+# so any node can answer /jobs/<id>; unset keeps jobs in-process. The only
+# built-in backend, 'sqlite:///path' (or a bare path), is for tests and nodes
+# on one host: SQLite locking is not safe over NFS/SMB, so nodes on several
+# machines need a JobStore for a server database (see JOB_STORE_BACKENDS)
+JOB_STORE = os.environ.get('JOB_STORE', '')
+# Catalog database; point every node on a host at the same file to list all
+# downloads (SQLite, so the same single-host caveat applies)
+CATALOG_DB = os.environ.get('CATALOG_DB', '')
+
+
+def default_node_id():
+    """NODE_ID when unset: 'local' for a lone node, else an id kept in CACHE_DIR
+
+    Hostnames change when a container is recreated, which would orphan this
+    node's catalog rows and leases, so a shared setup generates an id once
+    and reuses it for as long as CACHE_DIR persists.
+    """
+    if not (JOB_STORE or CATALOG_DB):
+        return 'local'
+    path = os.path.join(CACHE_DIR, 'node-id')
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            node = f.read().strip()
+        if node:
+            return node
+    node = f'{socket.gethostname()}-{uuid.uuid4().hex[:8]}'
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(node)
+    return node
+
+
+# Name of this node (one DOWNLOAD_DIR), and the base URL other nodes redirect
+# file requests to for items downloaded here. Set NODE_ID explicitly when
+# CACHE_DIR is not on a persistent volume
+NODE_ID = os.environ.get('NODE_ID') or default_node_id()
+NODE_URL = os.environ.get('NODE_URL', '').rstrip('/')
+# 'all' serves HTTP and runs download workers, 'web' only serves, 'worker' only downloads
+NODE_ROLE = os.environ.get('NODE_ROLE', 'all')
+# Seconds a claimed job is leased without a heartbeat; jobs whose lease runs
+# out (their node died) are handed to another worker, up to JOB_MAX_ATTEMPTS runs
+JOB_LEASE = int(os.environ.get('JOB_LEASE', 60))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+# How often idle workers look for jobs submitted on other nodes
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1.0))
+# Import yt-dlp and instaloader at startup rather than on the first download
+# that needs them; the default is on only for worker nodes, which always do
+PRELOAD_EXTRACTORS = os.environ.get('PRELOAD_EXTRACTORS', '1' if NODE_ROLE == 'worker' else '0') == '1'
+
+# Number of background workers running queued downloads
+DOWNLOAD_WORKERS = int(os.environ.get('DOWNLOAD_WORKERS', 4))
+# Seconds a finished job stays queryable through /jobs/<id>
+JOB_TTL = int(os.environ.get('JOB_TTL', 3600))
+
+# Read size used when relaying media through /stream
+STREAM_CHUNK_SIZE = int(os.environ.get('STREAM_CHUNK_SIZE', 256 * 1024))
+# Only single-file formats fetched over plain HTTP(S) can be relayed as-is
+STREAM_FORMAT = 'best[vcodec!=none][acodec!=none][protocol^=http]/best[protocol^=http]'
+# nginx internal location mapped to DOWNLOAD_DIR (e.g. /protected-downloads/);
+# when set, file transfers are handed to nginx through X-Accel-Redirect
+ACCEL_REDIRECT_PREFIX = os.environ.get('ACCEL_REDIRECT_PREFIX', '')
+
+# 'asgi' serves through uvicorn and AsgiBridge instead of the Flask dev server
+SERVER_MODE = os.environ.get('SERVER_MODE', 'dev')
+# ASGI mode: threads running Flask views (which may call into yt-dlp or
+# instaloader), and threads reading response bodies chunk by chunk
+ASGI_REQUEST_WORKERS = int(os.environ.get('ASGI_REQUEST_WORKERS', 32))
+ASGI_IO_WORKERS = int(os.environ.get('ASGI_IO_WORKERS', 16))
+
+
+# Maximum downloads running at once across all bulk jobs. This and the
+# per-platform caps apply to each node separately; with several worker
+# nodes, divide them by the node count (instagram=1 on three nodes is three
+# concurrent Instagram downloads)
+MAX_CONCURRENT_DOWNLOADS = int(os.environ.get('MAX_CONCURRENT_DOWNLOADS', 8))
+# Per-platform caps (keys match detect_platform); 'default' covers the rest
+PLATFORM_CONCURRENCY = parse_platform_limits(os.environ.get('PLATFORM_CONCURRENCY'), {
+    'youtube': 4,
+    'instagram': 1,
+    'default': 2,
+})
+
+class LazyModule:
+    """Stand-in for a heavy module that imports it on first attribute access
+
+    Processes that only serve listings and files never load yt-dlp's
+    extractor registry or instaloader.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.module = None
+
+    def load(self):
+        if self.module is None:
+            self.module = importlib.import_module(self.name)
+        return self.module
+
+    def __getattr__(self, attribute):
+        return getattr(self.load(), attribute)
+
+
+yt_dlp = LazyModule('yt_dlp')
+instaloader = LazyModule('instaloader')
+
+
+def preload_extractors():
+    """Load the extractor libraries now so the first download doesn't pay for it"""
+    started = time.perf_counter()
+    yt_dlp.load()
+    instaloader.load()
+    yt_dlp.extractor.gen_extractor_classes()
+    print(f"Preloaded yt-dlp and instaloader in {time.perf_counter() - started:.2f}s")
+
+
+# Query parameters that only track where a link was shared from, on any
+# host (along with every utm_* parameter)
+TRACKING_PARAMS = {'fbclid', 'gclid'}
+# Share parameters that are noise only on these hosts; elsewhere short names
+# like 's', 't' or 'ref' can select the content itself
+HOST_TRACKING_PARAMS = {
+    'youtube.com': {'si', 'feature', 'pp', 't'},
+    'music.youtube.com': {'si', 'feature', 'pp', 't'},
+    'twitter.com': {'s', 't', 'ref_src', 'ref_url'},
+    'instagram.com': {'igshid', 'igsh'},
+    'tiktok.com': {'is_from_webapp', 'sender_device', 'share_id'},
+    'facebook.com': {'mibextid', 'rdt'},
+    'reddit.com': {'share_id', 'rdt', 'ref', 'ref_source'},
+}
+
+
+def canonicalize_url(url):
+    """Normalize a media URL so different share links map to the same key"""
+    url = url.strip()
+    if '://' not in url:
+        url = 'https://' + url
+    parts = urlsplit(url)
+    host = parts.netloc.lower()
+    for prefix in ('www.', 'm.', 'mobile.'):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+            break
+    path = parts.path.rstrip('/') or '/'
+    query = parse_qsl(parts.query, keep_blank_values=True)
+
+    # youtu.be/<id> and /shorts/<id> are the same video as /watch?v=<id>
+    if host == 'youtu.be' and path != '/':
+        query = [('v', path.lstrip('/'))] + query
+        host, path = 'youtube.com', '/watch'
+    elif host in ('youtube.com', 'music.youtube.com') and path.startswith(('/shorts/', '/live/', '/embed/')):
+        query = [('v', path.split('/')[2])] + query
+        host, path = 'youtube.com', '/watch'
+    elif host == 'x.com':
+        host = 'twitter.com'
+
+    noise = TRACKING_PARAMS | HOST_TRACKING_PARAMS.get(host, set())
+    query = [(k, v) for k, v in query if k.lower() not in noise and not k.lower().startswith('utm_')]
+    return urlunsplit(('https', host, path, urlencode(sorted(query)), ''))
+
+
+class Metrics:
+    """Minimal in-process registry rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.types = {}
+        self.help = {}
+        self.values = {}
+        self.collectors = []
+
+    def register(self, name, kind, help_text):
+        self.types[name] = kind
+        self.help[name] = help_text
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.values[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, **labels):
+        """Add one observation to a summary (exported as _sum and _count)"""
+        self.inc(f'{name}_sum', value, **labels)
+        self.inc(f'{name}_count', 1, **labels)
+
+    @contextmanager
+    def timed(self, stage, platform):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('downloader_stage_seconds', time.perf_counter() - started, stage=stage, platform=platform)
+
+    def render(self):
+        for collect in self.collectors:
+            collect(self)
+        with self.lock:
+            values = sorted(self.values.items())
+        lines = []
+        for name, kind in self.types.items():
+            lines.append(f'# HELP {name} {self.help[name]}')
+            lines.append(f'# TYPE {name} {kind}')
+            series = (name, f'{name}_sum', f'{name}_count') if kind == 'summary' else (name,)
+            for (sample, labels), value in values:
+                if sample in series:
+                    label_text = ','.join(f'{k}="{v}"' for k, v in labels)
+                    lines.append(f'{sample}{{{label_text}}} {value}' if label_text else f'{sample} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+class StageTracker:
+    """Split one yt-dlp run into extract, transfer and merge timings via its hooks"""
+
+    def __init__(self, platform):
+        self.platform = platform
+        self.started = time.perf_counter()
+        self.extracted = None
+        self.postprocessors = {}
+        self.lock = threading.Lock()
+
+    def mark_extracted(self):
+        with self.lock:
+            if self.extracted is not None:
+                return
+            self.extracted = time.perf_counter()
+        metrics.observe('downloader_stage_seconds', self.extracted - self.started,
+                        stage='extract', platform=self.platform)
+
+    def progress(self, d):
+        # The first progress event means extraction is over and bytes are flowing
+        self.mark_extracted()
+        if d.get('status') == 'finished':
+            size = d.get('total_bytes') or d.get('downloaded_bytes') or 0
+            elapsed = d.get('elapsed') or 0
+            metrics.inc('downloader_bytes_total', size, platform=self.platform)
+            metrics.observe('downloader_stage_seconds', elapsed, stage='transfer', platform=self.platform)
+            if elapsed:
+                metrics.set('downloader_transfer_bytes_per_second', size / elapsed, platform=self.platform)
+
+    def postprocess(self, d):
+        name = d.get('postprocessor')
+        if d.get('status') == 'started':
+            self.postprocessors[name] = time.perf_counter()
+        elif d.get('status') == 'finished' and name in self.postprocessors:
+            stage = 'merge' if name == 'Merger' else 'postprocess'
+            metrics.observe('downloader_stage_seconds', time.perf_counter() - self.postprocessors.pop(name),
+                            stage=stage, platform=self.platform)
+
+
+class DownloadRun:
+    """Per-run state behind the hooks of a pooled YoutubeDL
+
+    Each instance gets one progress hook and one postprocessor hook when it
+    is created; they forward to whatever run is set as ydl.run, so a run
+    only has to swap that attribute.
+    """
+
+    def __init__(self, platform, url):
+        self.tracker = StageTracker(platform)
+        self.throttle = scheduler.throttle(platform)
+        self.report = progress.reporter(url)
+
+    @staticmethod
+    def install(ydl):
+        ydl.run = None
+        ydl.add_progress_hook(lambda d: ydl.run and ydl.run.progress(d))
+        ydl.add_postprocessor_hook(lambda d: ydl.run and ydl.run.postprocess(d))
+
+    def progress(self, d):
+        self.tracker.progress(d)
+        if self.throttle:
+            self.throttle(d)
+        if self.report:
+            self.report(d)
+
+    def postprocess(self, d):
+        self.tracker.postprocess(d)
+
+
+class MetadataCache:
+    """SQLite-backed info-dict cache keyed by canonical URL, with TTL and LRU eviction
+
+    Entries are extractor results before format selection, so replaying one
+    picks formats with the caller's own options.
+    """
+
+    # Bumped when cached entries change shape; older entries are dropped
+    VERSION = 1
+
+    def __init__(self, path=None, ttl=METADATA_CACHE_TTL, max_entries=METADATA_CACHE_SIZE):
+        self.path = path or os.path.join(CACHE_DIR, 'metadata.sqlite3')
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute('''CREATE TABLE IF NOT EXISTS metadata (
+            key TEXT PRIMARY KEY,
+            info TEXT NOT NULL,
+            created REAL NOT NULL,
+            accessed REAL NOT NULL
+        )''')
+        self.db.execute('CREATE INDEX IF NOT EXISTS metadata_accessed ON metadata (accessed)')
+        if self.db.execute('PRAGMA user_version').fetchone()[0] < self.VERSION:
+            # Version 0 stored info dicts after format selection
+            self.db.execute('DELETE FROM metadata')
+            self.db.execute(f'PRAGMA user_version = {self.VERSION}')
+        self.db.commit()
+
+    def get(self, url):
+        """Return the cached info dict for url, or None if missing or expired"""
+        key = canonicalize_url(url)
+        now = time.time()
+        with self.lock:
+            row = self.db.execute('SELECT info, created FROM metadata WHERE key = ?', (key,)).fetchone()
+            if not row:
+                return None
+            if now - row[1] > self.ttl:
+                self.db.execute('DELETE FROM metadata WHERE key = ?', (key,))
+                self.db.commit()
+                return None
+            self.db.execute('UPDATE metadata SET accessed = ? WHERE key = ?', (now, key))
+            self.db.commit()
+        return json.loads(row[0])
+
+    def set(self, url, info):
+        key = canonicalize_url(url)
+        now = time.time()
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO metadata (key, info, created, accessed) VALUES (?, ?, ?, ?)',
+                            (key, json.dumps(info), now, now))
+            # Drop least recently used entries beyond the size limit
+            self.db.execute('''DELETE FROM metadata WHERE key IN (
+                SELECT key FROM metadata ORDER BY accessed DESC LIMIT -1 OFFSET ?)''', (self.max_entries,))
+            self.db.commit()
+
+    def delete(self, url):
+        with self.lock:
+            self.db.execute('DELETE FROM metadata WHERE key = ?', (canonicalize_url(url),))
+            self.db.commit()
+
+
+class DedupStore:
+    """Index of finished media files keyed by (extractor, media id, format)
+
+    A repeat download of an indexed item is satisfied by hardlinking the
+    existing file into the new folder instead of fetching it again.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(CACHE_DIR, 'dedup.sqlite3')
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute('''CREATE TABLE IF NOT EXISTS media (
+            key TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created REAL NOT NULL
+        )''')
+        self.db.commit()
+
+    @staticmethod
+    def make_key(info):
+        """Key for a resolved info dict, or None if it lacks an id"""
+        if not info.get('id'):
+            return None
+        extractor = info.get('extractor_key') or info.get('extractor') or 'generic'
+        return f"{extractor}:{info['id']}:{info.get('format_id', 'default')}:{info.get('ext', '')}"
+
+    def lookup(self, key):
+        """Return the path stored for key if the file is still intact"""
+        with self.lock:
+            row = self.db.execute('SELECT path, size FROM media WHERE key = ?', (key,)).fetchone()
+            if not row:
+                return None
+            if os.path.isfile(row[0]) and os.path.getsize(row[0]) == row[1]:
+                return row[0]
+            self.db.execute('DELETE FROM media WHERE key = ?', (key,))
+            self.db.commit()
+        return None
+
+    def record(self, key, path):
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO media (key, path, size, created) VALUES (?, ?, ?, ?)',
+                            (key, path, os.path.getsize(path), time.time()))
+            self.db.commit()
+
+    def link_into(self, source, target):
+        """Hardlink source to target, copying when the filesystem can't link"""
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if os.path.exists(target):
+            return target
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copy2(source, target)
+        return target
+
+    def attach(self, ydl):
+        """Hook this store into a YoutubeDL instance"""
+        store = self
+
+        def match_filter(info, *, incomplete=False):
+            if incomplete:
+                return None
+            key = store.make_key(info)
+            source = store.lookup(key) if key else None
+            if not source:
+                return None
+            target = ydl.prepare_filename(info)
+            store.link_into(source, target)
+            info['filepath'] = target
+            # A linked item counts as fetched for incremental syncs
+            ydl.record_download_archive(info)
+            return f'{info.get("title", info["id"])} is already on disk, linked {os.path.basename(target)}'
+
+        class DedupRecorder(yt_dlp.postprocessor.PostProcessor):
+            def run(self, info):
+                key = store.make_key(info)
+                if key and info.get('filepath') and os.path.isfile(info['filepath']):
+                    store.record(key, info['filepath'])
+                return [], info
+
+        ydl.params['match_filter'] = match_filter
+        # Pooled instances are attached on every download; record only once
+        if not getattr(ydl, 'dedup_recorder', None):
+            ydl.dedup_recorder = DedupRecorder(ydl)
+            ydl.add_post_processor(ydl.dedup_recorder, when='after_move')
+        return ydl
+
+
+class DownloadCatalog:
+    """SQLite index of DOWNLOAD_DIR entries so /downloads never scans the disk
+
+    Rows belong to the node whose DOWNLOAD_DIR holds them. Several nodes may
+    share one catalog file; quota, eviction and rebuilds only look at this
+    node's rows, while list() shows everyone's.
+    """
+
+    SORT_COLUMNS = {'created', 'accessed', 'title', 'size', 'file_count', 'name', 'platform', 'node'}
+
+    def __init__(self, path=None, root=DOWNLOAD_DIR, node=NODE_ID, origin=NODE_URL):
+        self.path = path or os.path.join(CACHE_DIR, 'catalog.sqlite3')
+        self.root = root
+        self.node = node
+        self.origin = origin
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self.db.execute('''CREATE TABLE IF NOT EXISTS downloads (
+            node TEXT NOT NULL,
+            origin TEXT,
+            name TEXT NOT NULL,
+            type TEXT NOT NULL,
+            platform TEXT,
+            title TEXT,
+            file_count INTEGER NOT NULL DEFAULT 0,
+            size INTEGER NOT NULL DEFAULT 0,
+            thumbnail TEXT,
+            preview TEXT,
+            created REAL NOT NULL,
+            accessed REAL,
+            PRIMARY KEY (node, name)
+        )''')
+        columns = [row[1] for row in self.db.execute('PRAGMA table_info(downloads)')]
+        if 'node' not in columns:
+            # Catalogs from before multi-node mode only ever held this node's items
+            self.db.execute('ALTER TABLE downloads ADD COLUMN node TEXT')
+            self.db.execute('ALTER TABLE downloads ADD COLUMN origin TEXT')
+            self.db.execute('UPDATE downloads SET node = ?', (node,))
+        if 'preview' not in columns:
+            self.db.execute('ALTER TABLE downloads ADD COLUMN preview TEXT')
+        if 'accessed' not in columns:
+            self.db.execute('ALTER TABLE downloads ADD COLUMN accessed REAL')
+        if path is None:
+            # A private catalog only holds this node's rows, whatever NODE_ID
+            # they were written under
+            self.db.execute('UPDATE OR REPLACE downloads SET node = ?, origin = ? WHERE node IS NOT ?',
+                            (node, origin, node))
+        self.db.execute('CREATE INDEX IF NOT EXISTS downloads_created ON downloads (created)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS downloads_accessed ON downloads (node, accessed)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS downloads_platform ON downloads (platform, created)')
+        # Files of each item by inode, so bytes hardlinked into several items
+        # (see DedupStore) count once towards this node's usage
+        self.db.execute('''CREATE TABLE IF NOT EXISTS files (
+            node TEXT NOT NULL,
+            name TEXT NOT NULL,
+            dev INTEGER NOT NULL,
+            ino INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            PRIMARY KEY (node, name, dev, ino)
+        )''')
+        self.db.execute('CREATE INDEX IF NOT EXISTS files_inode ON files (node, dev, ino)')
+        self.db.commit()
+        # Rows recorded before the files table existed have no sizes in it
+        self.needs_rebuild = bool(self.count()) and not self.db.execute(
+            'SELECT 1 FROM files WHERE node = ? LIMIT 1', (node,)).fetchone()
+
+    @staticmethod
+    def inode(path, st):
+        """(dev, ino) of a file; paths stand in where the platform reports no inode"""
+        return (st.st_dev, st.st_ino) if st.st_ino else (0, int(hashlib.sha1(path.encode()).hexdigest()[:15], 16))
+
+    def describe(self, name, platform=None, title=None):
+        """Build a catalog row for one entry of the download directory
+
+        'size' counts each inode once; 'inodes' maps (dev, ino) to size for
+        the files table.
+        """
+        item_path = os.path.join(self.root, name)
+        if os.path.isfile(item_path):
+            st = os.stat(item_path)
+            return {
+                'name': name,
+                'type': 'file',
+                'platform': platform,
+                'title': title or os.path.splitext(name)[0],
+                'file_count': 1,
+                'size': st.st_size,
+                'inodes': {self.inode(item_path, st): st.st_size},
+                'thumbnail': None,
+                'preview': None,
+                'created': st.st_mtime,
+                'accessed': st.st_mtime
+            }
+        
+        media_files = []
+        thumbnail = None
+        inodes = {}
+        for entry in os.scandir(item_path):
+            if not entry.is_file():
+                continue
+            lower = entry.name.lower()
+            st = entry.stat()
+            inodes[self.inode(entry.path, st)] = st.st_size
+            if lower.endswith(MEDIA_EXTENSIONS):
+                media_files.append(entry.name)
+            elif thumbnail is None and lower.startswith('thumbnail') and lower.endswith(('.jpg', '.jpeg', '.png', '.webp')):
+                thumbnail = f'/download-file/{name}/{entry.name}'
+        media_files.sort()
+        
+        # Fall back to thumbnails generated in the background
+        generated = ThumbnailGenerator.existing(name)
+        thumbnail = thumbnail or generated['thumbnail']
+        
+        # Use first media file name as title if no explicit title
+        if not title and media_files:
+            title = os.path.splitext(media_files[0])[0]
+        
+        return {
+            'name': name,
+            'type': 'folder',
+            'platform': platform or name.split('_', 1)[0],
+            'title': title or name,
+            'file_count': len(media_files),
+            'size': sum(inodes.values()),
+            'inodes': inodes,
+            'thumbnail': thumbnail,
+            'preview': generated['preview'],
+            'created': os.path.getmtime(item_path),
+            'accessed': os.path.getmtime(item_path)
+        }
+
+    def record(self, name, platform=None, title=None):
+        """Add or refresh the catalog row for name"""
+        if not os.path.exists(os.path.join(self.root, name)):
+            return
+        row = dict(self.describe(name, platform, title), node=self.node, origin=self.origin)
+        inodes = row.pop('inodes')
+        with self.lock:
+            self.db.execute('''INSERT OR REPLACE INTO downloads
+                (node, origin, name, type, platform, title, file_count, size, thumbnail, preview, created, accessed)
+                VALUES (:node, :origin, :name, :type, :platform, :title, :file_count, :size, :thumbnail, :preview,
+                        :created, :accessed)''', row)
+            self.db.execute('DELETE FROM files WHERE node = ? AND name = ?', (self.node, name))
+            self.db.executemany('INSERT INTO files (node, name, dev, ino, size) VALUES (?, ?, ?, ?, ?)',
+                                [(self.node, name, dev, ino, size) for (dev, ino), size in inodes.items()])
+            self.db.commit()
+
+    def set_thumbnail(self, name, thumbnail, preview=None):
+        with self.lock:
+            self.db.execute('UPDATE downloads SET thumbnail = COALESCE(thumbnail, ?), preview = ? '
+                            'WHERE node = ? AND name = ?', (thumbnail, preview, self.node, name))
+            self.db.commit()
+
+    def remove(self, name):
+        with self.lock:
+            self.db.execute('DELETE FROM downloads WHERE node = ? AND name = ?', (self.node, name))
+            self.db.execute('DELETE FROM files WHERE node = ? AND name = ?', (self.node, name))
+            self.db.commit()
+
+    def touch(self, name):
+        """Mark name as just used, for LRU eviction"""
+        with self.lock:
+            self.db.execute('UPDATE downloads SET accessed = ? WHERE node = ? AND name = ?',
+                            (time.time(), self.node, name))
+            self.db.commit()
+
+    def total_size(self):
+        """Bytes this node's items use on disk, hardlinked files counted once"""
+        with self.lock:
+            return self.db.execute('SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT dev, ino, size '
+                                   'FROM files WHERE node = ?)', (self.node,)).fetchone()[0]
+
+    def exclusive_size(self, name):
+        """Bytes deleting name would free: files not hardlinked into another item"""
+        with self.lock:
+            return self.db.execute('''SELECT COALESCE(SUM(size), 0) FROM files AS f
+                WHERE node = :node AND name = :name AND NOT EXISTS (
+                    SELECT 1 FROM files AS o WHERE o.node = f.node AND o.dev = f.dev AND o.ino = f.ino
+                    AND o.name != f.name)''', {'node': self.node, 'name': name}).fetchone()[0]
+
+    def least_recently_used(self):
+        """Item names, least recently accessed first"""
+        with self.lock:
+            return [row[0] for row in self.db.execute(
+                'SELECT name FROM downloads WHERE node = ? ORDER BY COALESCE(accessed, created) ASC',
+                (self.node,))]
+
+    def clear(self):
+        with self.lock:
+            self.db.execute('DELETE FROM downloads WHERE node = ?', (self.node,))
+            self.db.execute('DELETE FROM files WHERE node = ?', (self.node,))
+            self.db.commit()
+
+    def count(self):
+        with self.lock:
+            return self.db.execute('SELECT COUNT(*) FROM downloads WHERE node = ?', (self.node,)).fetchone()[0]
+
+    def locate(self, name):
+        """Base URL of another node holding name, if any"""
+        with self.lock:
+            row = self.db.execute(
+                'SELECT origin FROM downloads WHERE name = ? AND node != ? AND origin IS NOT NULL LIMIT 1',
+                (name, self.node)).fetchone()
+        return row[0] if row else None
+
+    def rebuild(self):
+        """Re-index everything in the download directory (one full scan)"""
+        self.clear()
+        if os.path.exists(self.root):
+            for entry in os.scandir(self.root):
+                self.record(entry.name)
+
+    def list(self, page=1, per_page=50, sort='created', order='desc', platform=None):
+        """Return (items, total) for one page of the catalog"""
+        if sort not in self.SORT_COLUMNS:
+            sort = 'created'
+        order = 'ASC' if str(order).lower() == 'asc' else 'DESC'
+        where, params = '', []
+        if platform:
+            where, params = 'WHERE platform = ?', [platform]
+        with self.lock:
+            total = self.db.execute(f'SELECT COUNT(*) FROM downloads {where}', params).fetchone()[0]
+            cursor = self.db.execute(
+                f'SELECT name, type, platform, title, file_count, size, thumbnail, preview, created, node '
+                f'FROM downloads {where} ORDER BY {sort} {order}, name {order} LIMIT ? OFFSET ?',
+                params + [per_page, (page - 1) * per_page])
+            columns = [column[0] for column in cursor.description]
+            items = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        return items, total
+
+
+class ExtractorPool:
+    """Warm, reusable yt-dlp and instaloader instances per options profile
+
+    Each instance is used by one caller at a time. Pooled YoutubeDL objects
+    keep their HTTP connection pools open between downloads, and every
+    instance using the same cookie file shares a single parsed cookie jar.
+    """
+
+    def __init__(self, max_idle=EXTRACTOR_POOL_SIZE):
+        self.max_idle = max_idle
+        self.idle = {}
+        self.cookie_jars = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def checkout(self, key, factory):
+        with self.lock:
+            instances = self.idle.get(key)
+            instance = instances.pop() if instances else None
+        if instance is None:
+            instance = factory()
+        try:
+            yield instance
+        finally:
+            with self.lock:
+                instances = self.idle.setdefault(key, [])
+                if len(instances) < self.max_idle:
+                    instances.append(instance)
+
+    def shared_cookie_jar(self, ydl):
+        """Parse each cookie file once and hand the same jar to every instance"""
+        cookiefile = ydl.params['cookiefile']
+        with self.lock:
+            jar = self.cookie_jars.get(cookiefile)
+            if jar is None:
+                jar = self.cookie_jars[cookiefile] = ydl.cookiejar
+        return jar
+
+    def save_cookies(self, ydl):
+        """Write cookies refreshed during a run back to the cookie file
+
+        Pooled instances are never closed, so this stands in for the save
+        YoutubeDL.close() would do.
+        """
+        if not ydl.params.get('cookiefile'):
+            return
+        jar = ydl.cookiejar
+        try:
+            # The jar's own lock keeps other instances from changing it mid-write
+            with jar._cookies_lock:
+                jar.save()
+        except Exception as e:
+            print(f"Failed to save cookies to {ydl.params['cookiefile']}: {e}")
+
+    @contextmanager
+    def youtube_dl(self, profile, ydl_opts):
+        """Check out a YoutubeDL for ydl_opts; outtmpl may differ per call"""
+        opts = dict(ydl_opts)
+        outtmpl = opts.pop('outtmpl', None)
+        key = ('yt-dlp', profile, json.dumps(opts, sort_keys=True, default=str))
+
+        def create():
+            ydl = yt_dlp.YoutubeDL(opts)
+            DownloadRun.install(ydl)
+            if opts.get('cookiefile'):
+                # YoutubeDL.cookiejar is a cached property; seed it before first use
+                ydl.__dict__['cookiejar'] = self.shared_cookie_jar(ydl)
+            return ydl
+
+        if opts.get('download_archive') is not None:
+            # The archive is read once at construction, so these can't be shared
+            ydl = create()
+            ydl.params['outtmpl']['default'] = outtmpl or yt_dlp.utils.DEFAULT_OUTTMPL['default']
+            with ydl:
+                yield ydl
+            return
+
+        with self.checkout(key, create) as ydl:
+            ydl.params['outtmpl']['default'] = outtmpl or yt_dlp.utils.DEFAULT_OUTTMPL['default']
+            ydl.params.pop('match_filter', None)
+            try:
+                yield ydl
+            finally:
+                self.save_cookies(ydl)
+
+    @contextmanager
+    def instaloader(self, path, **loader_opts):
+        """Check out an Instaloader writing into path"""
+        key = ('instaloader', json.dumps(loader_opts, sort_keys=True))
+
+        def create():
+            loader = instaloader.Instaloader(dirname_pattern=path, rate_controller=scheduler_rate_controller(),
+                                             **loader_opts)
+            if INSTAGRAM_USERNAME:
+                try:
+                    loader.load_session_from_file(INSTAGRAM_USERNAME)
+                except FileNotFoundError:
+                    print(f"No saved Instagram session for {INSTAGRAM_USERNAME}, continuing anonymously")
+            return loader
+
+        with self.checkout(key, create) as loader:
+            loader.dirname_pattern = path
+            yield loader
+
+
+class SingleFlight:
+    """Let concurrent callers with the same key share one call and its result"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def attach(self, key):
+        """Return the call in flight for key, or None"""
+        with self.lock:
+            return self.calls.get(key)
+
+    def claim(self, key):
+        """Return (call, leader): a new call for key that the caller must run, or the one in flight"""
+        with self.lock:
+            call = self.calls.get(key)
+            if call is not None:
+                return call, False
+            call = self.calls[key] = {'key': key, 'done': threading.Event(), 'result': None, 'error': None}
+            return call, True
+
+    def run(self, call, func):
+        """Run func() for a call this caller leads and return its result"""
+        try:
+            call['result'] = func()
+        except Exception as e:
+            call['error'] = e
+        finally:
+            self.finish(call)
+        return self.wait(call)
+
+    def abandon(self, call, reason):
+        """Fail a claimed call that will never run, releasing its waiters"""
+        if not call['done'].is_set():
+            call['error'] = RuntimeError(reason)
+            self.finish(call)
+
+    def finish(self, call):
+        with self.lock:
+            if self.calls.get(call['key']) is call:
+                del self.calls[call['key']]
+        call['done'].set()
+
+    def wait(self, call):
+        """Wait for call; every caller gets its own copy of the result to annotate"""
+        call['done'].wait()
+        if call['error'] is not None:
+            raise call['error']
+        return copy.deepcopy(call['result'])
+
+
+class ResumeIndex:
+    """Remember the folder of each unfinished download so a retry resumes it
+
+    yt-dlp keeps .part files and continues them when the same output path is
+    used again, so reusing the folder turns a retry (even after a restart)
+    into a resume instead of a fresh download. The .part files live in this
+    node's DOWNLOAD_DIR, so the index is per node even with a JOB_STORE.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(CACHE_DIR, 'resume.sqlite3')
+        self.lock = threading.Lock()
+        self.active = set()
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute('''CREATE TABLE IF NOT EXISTS partial (
+            key TEXT PRIMARY KEY,
+            folder TEXT NOT NULL,
+            updated REAL NOT NULL
+        )''')
+        self.db.commit()
+
+    @staticmethod
+    def key(url, quality=None):
+        """Folders hold one quality profile's .part files, so the profile is part of the key"""
+        key = canonicalize_url(url)
+        return f'{key}#{quality}' if quality else key
+
+    def claim(self, url, path, create_folder, quality=None):
+        """Return an unfinished folder for url (at quality) under path, or a new one"""
+        key = self.key(url, quality)
+        with self.lock:
+            row = self.db.execute('SELECT folder FROM partial WHERE key = ?', (key,)).fetchone()
+            if (row and row[0] not in self.active and os.path.isdir(row[0]) and
+                    os.path.dirname(row[0]) == os.path.abspath(path)):
+                folder = row[0]
+            else:
+                folder = os.path.abspath(create_folder())
+            self.active.add(folder)
+            self.db.execute('INSERT OR REPLACE INTO partial (key, folder, updated) VALUES (?, ?, ?)',
+                            (key, folder, time.time()))
+            self.db.commit()
+        return folder
+
+    def release(self, url, folder, finished, quality=None):
+        """Stop using folder; forget it once the download has finished"""
+        with self.lock:
+            self.active.discard(folder)
+            if finished:
+                self.db.execute('DELETE FROM partial WHERE key = ? AND folder = ?',
+                                (self.key(url, quality), folder))
+                self.db.commit()
+
+    def clear(self):
+        with self.lock:
+            self.db.execute('DELETE FROM partial')
+            self.db.commit()
+
+
+class SyncArchive:
+    """Media ids already fetched from one /sync source
+
+    Set-like, so yt-dlp takes it as download_archive and keeps it updated
+    through add(). Entries live in the shared JobStore when there is one, so
+    a source synced on any node is not fetched again on another; otherwise
+    they go to a file under SYNC_ARCHIVE_DIR.
+    """
+
+    def __init__(self, source, store=None):
+        self.source = source
+        self.store = store
+        self.path = os.path.join(SYNC_ARCHIVE_DIR, f'{source}.txt')
+        self.lock = threading.Lock()
+        self.entries = self.load()
+
+    def load(self):
+        if self.store:
+            return self.store.archive_entries(self.source)
+        if not os.path.exists(self.path):
+            return set()
+        with open(self.path, encoding='utf-8') as f:
+            return {line.strip() for line in f if line.strip()}
+
+    def __contains__(self, entry):
+        return entry in self.entries
+
+    def __iter__(self):
+        return iter(set(self.entries))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, entry):
+        with self.lock:
+            if entry in self.entries:
+                return
+            self.entries.add(entry)
+            if self.store:
+                self.store.archive_add(self.source, entry)
+            else:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(f'{entry}\n')
+
+
+class ThumbnailGenerator:
+    """Build small local thumbnails for finished downloads on a background pool
+
+    With ffmpeg a frame is grabbed from the first video (or the first image is
+    scaled down); without it the extractor's remote thumbnail is fetched once.
+    Results land in THUMBNAIL_DIR and the catalog, so listings never wait.
+    """
+
+    VIDEO_EXTENSIONS = ('.mp4', '.webm', '.mkv', '.mov')
+    IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+    def __init__(self, workers=THUMBNAIL_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='thumbnail')
+
+    @staticmethod
+    def paths(name):
+        return (os.path.join(THUMBNAIL_DIR, f'{name}.jpg'),
+                os.path.join(THUMBNAIL_DIR, f'{name}-preview.jpg'))
+
+    @staticmethod
+    def existing(name):
+        """URLs of already generated images for name"""
+        thumbnail_path, preview_path = ThumbnailGenerator.paths(name)
+        return {
+            'thumbnail': f'/thumbnails/{name}.jpg' if os.path.exists(thumbnail_path) else None,
+            'preview': f'/thumbnails/{name}-preview.jpg' if os.path.exists(preview_path) else None,
+        }
+
+    def submit(self, name, remote_thumbnail=None):
+        self.executor.submit(self.generate, name, remote_thumbnail)
+
+    def ffmpeg(self, *args):
+        result = subprocess.run([FFMPEG, '-nostdin', '-loglevel', 'error', '-y', *args],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=120)
+        return result.returncode == 0
+
+    def generate(self, name, remote_thumbnail=None):
+        try:
+            folder = os.path.join(DOWNLOAD_DIR, name)
+            if not os.path.isdir(folder):
+                return
+            thumbnail_path, preview_path = self.paths(name)
+            files = sorted(entry.path for entry in os.scandir(folder) if entry.is_file())
+            videos = [f for f in files if f.lower().endswith(self.VIDEO_EXTENSIONS)]
+            images = [f for f in files if f.lower().endswith(self.IMAGE_EXTENSIONS)]
+            scale = f'scale={THUMBNAIL_WIDTH}:-2'
+            
+            if not os.path.exists(thumbnail_path):
+                tmp_path = thumbnail_path + '.tmp.jpg'
+                made = False
+                if FFMPEG and videos:
+                    made = (self.ffmpeg('-ss', '1', '-i', videos[0], '-frames:v', '1', '-vf', scale, tmp_path) or
+                            self.ffmpeg('-i', videos[0], '-frames:v', '1', '-vf', scale, tmp_path))
+                elif FFMPEG and images:
+                    made = self.ffmpeg('-i', images[0], '-vf', scale, tmp_path)
+                if not made and remote_thumbnail:
+                    response = downloader.session.get(remote_thumbnail, timeout=30)
+                    if response.ok:
+                        with open(tmp_path, 'wb') as f:
+                            f.write(response.content)
+                        made = True
+                if made:
+                    os.replace(tmp_path, thumbnail_path)
+            
+            if THUMBNAIL_PREVIEWS and FFMPEG and videos and not os.path.exists(preview_path):
+                # Five frames, ten seconds apart, side by side
+                tmp_path = preview_path + '.tmp.jpg'
+                if self.ffmpeg('-i', videos[0], '-frames:v', '1',
+                               '-vf', f'fps=1/10,scale={THUMBNAIL_WIDTH // 2}:-2,tile=5x1', tmp_path):
+                    os.replace(tmp_path, preview_path)
+            
+            generated = self.existing(name)
+            if generated['thumbnail'] or generated['preview']:
+                catalog.set_thumbnail(name, generated['thumbnail'], generated['preview'])
+        except Exception as e:
+            print(f"Thumbnail generation failed for {name}: {e}")
+
+    def remove(self, name):
+        for path in self.paths(name):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class StorageManager:
+    """Keep DOWNLOAD_DIR under STORAGE_QUOTA by evicting least recently used items
+
+    Items are pinned while a download writes into them or a response is
+    sending one of their files; pinned items are never deleted. Deletion runs
+    outside the lock, with the item marked as being removed meanwhile.
+    """
+
+    def __init__(self, quota=STORAGE_QUOTA):
+        self.quota = quota
+        self.pins = {}
+        self.removing = set()
+        self.lock = threading.Lock()
+        self.removed = threading.Condition(self.lock)
+        self.wakeup = threading.Event()
+        if quota:
+            threading.Thread(target=self.evict_loop, name='storage-evictor', daemon=True).start()
+
+    @staticmethod
+    def item_name(path):
+        """Top-level DOWNLOAD_DIR entry that path belongs to"""
+        return os.path.relpath(path, DOWNLOAD_DIR).split(os.sep)[0]
+
+    def pin(self, name):
+        with self.lock:
+            # Let a removal in progress finish; the caller then finds the item gone
+            while name in self.removing:
+                self.removed.wait()
+            self.pins[name] = self.pins.get(name, 0) + 1
+
+    def unpin(self, name):
+        with self.lock:
+            self.pins[name] -= 1
+            if not self.pins[name]:
+                del self.pins[name]
+
+    def remove(self, name):
+        """Delete one item unless it is pinned; return True if it was removed"""
+        with self.lock:
+            if name in self.pins or name in self.removing:
+                return False
+            self.removing.add(name)
+        try:
+            item_path = os.path.join(DOWNLOAD_DIR, name)
+            if os.path.isdir(item_path):
+                shutil.rmtree(item_path, onerror=remove_readonly)
+            elif os.path.exists(item_path):
+                os.remove(item_path)
+            catalog.remove(name)
+            thumbnails.remove(name)
+        finally:
+            with self.lock:
+                self.removing.discard(name)
+                self.removed.notify_all()
+        return True
+
+    def request_check(self):
+        if self.quota:
+            self.wakeup.set()
+
+    def enforce(self):
+        """Evict LRU items until usage is back under the low watermark"""
+        total = catalog.total_size()
+        if not self.quota or total <= self.quota:
+            return 0
+        target = self.quota * STORAGE_LOW_WATERMARK
+        evicted = 0
+        for name in catalog.least_recently_used():
+            if total <= target:
+                break
+            size = catalog.exclusive_size(name)
+            if self.remove(name):
+                total -= size
+                evicted += 1
+                metrics.inc('downloader_evicted_bytes_total', size)
+        return evicted
+
+    def evict_loop(self):
+        while True:
+            self.wakeup.wait(STORAGE_CHECK_INTERVAL)
+            self.wakeup.clear()
+            try:
+                self.enforce()
+            except Exception as e:
+                print(f"Storage eviction failed: {e}")
+
+
 class UniversalDownloader:
     def __init__(self):
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         })
+        self.inflight = SingleFlight()
         
     def detect_platform(self, url):
         """Detect the platform from URL"""
@@ -60,7 +1276,7 @@ class UniversalDownloader:
             filename = filename[:max_length]
         return filename
     
-    def download_youtube_content(self, url, path):
+    def download_youtube_content(self, url, path, sync=False, quality=None):
         """Download YouTube videos, shorts, playlists"""
         try:
             ydl_opts = {
@@ -70,10 +1286,13 @@ class UniversalDownloader:
                 'merge_output_format': 'mp4',  # Ensures merged output
                 'quiet': False,
                 'cookiefile': os.path.join(os.getcwd(), 'cookies.txt'),
+                **self.transfer_options('youtube'),
+                **self.sync_options(url, sync),
+                **self.format_options(quality),
             }
             
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=True)
+            with extractor_pool.youtube_dl('youtube', ydl_opts) as ydl:
+                info = self.extract_info(ydl, url, sync=sync)
                 
                 if not info:
                     return {'status': 'error', 'message': 'No information extracted from the URL'}
@@ -99,11 +1318,11 @@ class UniversalDownloader:
         except Exception as e:
             return {'status': 'error', 'message': f'YouTube error: {str(e)}'}
     
-    def download_instagram_content(self, url, path):
+    def download_instagram_content(self, url, path, sync=False, quality=None):
         """Download Instagram posts, reels, stories, IGTV"""
         try:
-            loader = instaloader.Instaloader(
-                dirname_pattern=path,
+            with extractor_pool.instaloader(
+                path,
                 filename_pattern='{profile}{mediaid}{date_utc}',
                 download_videos=True,
                 download_video_thumbnails=False,
@@ -111,71 +1330,91 @@ class UniversalDownloader:
                 download_comments=False,
                 save_metadata=True,
                 compress_json=False
-            )
-            
-            # Handle different Instagram URL types
-            if '/stories/' in url:
-                # Story URL
-                username = self.extract_instagram_username(url)
-                if username:
-                    profile = instaloader.Profile.from_username(loader.context, username)
-                    for story in loader.get_stories([profile.userid]):
-                        for item in story.get_items():
-                            loader.download_storyitem(item, target=username)
-                    return {
-                        'status': 'success',
-                        'message': f'Instagram stories downloaded for {username}',
-                        'type': 'stories'
-                    }
-            elif '/reel/' in url or '/p/' in url or '/tv/' in url:
-                # Post, Reel, or IGTV
-                shortcode = self.extract_instagram_shortcode(url)
-                post = instaloader.Post.from_shortcode(loader.context, shortcode)
-                
-                loader.download_post(post, target=post.owner_username)
+            ) as loader:
+                return self.fetch_instagram_content(loader, url, sync)
                 
-                content_type = 'reel' if post.is_video else 'post'
-                if post.typename == 'GraphSidecar':
-                    content_type = 'carousel'
-                
-                return {
-                    'status': 'success',
-                    'message': f'Instagram {content_type} downloaded successfully!',
-                    'username': post.owner_username,
-                    'caption': post.caption[:100] + '...' if post.caption and len(post.caption) > 100 else post.caption,
-                    'type': content_type
-                }
-            else:
-                # Profile URL - download recent posts
-                username = self.extract_instagram_username(url)
+        except Exception as e:
+            return {'status': 'error', 'message': f'Instagram error: {str(e)}'}
+    
+    def fetch_instagram_content(self, loader, url, sync=False):
+        """Download an Instagram URL with a checked-out loader"""
+        # Handle different Instagram URL types
+        if '/stories/' in url:
+            # Story URL
+            username = self.extract_instagram_username(url)
+            if username:
                 profile = instaloader.Profile.from_username(loader.context, username)
-                
-                count = 0
-                for post in profile.get_posts():
-                    if count >= 10:  # Limit to 10 recent posts
-                        break
-                    loader.download_post(post, target=username)
-                    count += 1
-                
+                for story in loader.get_stories([profile.userid]):
+                    for item in story.get_items():
+                        loader.download_storyitem(item, target=username)
+                        progress.publish_current({'type': 'item', 'url': url, 'item': str(item.mediaid)})
                 return {
                     'status': 'success',
-                    'message': f'Downloaded {count} recent posts from {username}',
-                    'type': 'profile'
+                    'message': f'Instagram stories downloaded for {username}',
+                    'type': 'stories'
                 }
-                
-        except Exception as e:
-            return {'status': 'error', 'message': f'Instagram error: {str(e)}'}
+        elif '/reel/' in url or '/p/' in url or '/tv/' in url:
+            # Post, Reel, or IGTV
+            shortcode = self.extract_instagram_shortcode(url)
+            post = instaloader.Post.from_shortcode(loader.context, shortcode)
+            
+            loader.download_post(post, target=post.owner_username)
+            progress.publish_current({'type': 'item', 'url': url, 'item': post.shortcode})
+            
+            content_type = 'reel' if post.is_video else 'post'
+            if post.typename == 'GraphSidecar':
+                content_type = 'carousel'
+            
+            return {
+                'status': 'success',
+                'message': f'Instagram {content_type} downloaded successfully!',
+                'username': post.owner_username,
+                'caption': post.caption[:100] + '...' if post.caption and len(post.caption) > 100 else post.caption,
+                'type': content_type
+            }
+        else:
+            # Profile URL - download recent posts
+            username = self.extract_instagram_username(url)
+            profile = instaloader.Profile.from_username(loader.context, username)
+            
+            # Posts come newest first, so a sync can stop at the first known
+            # one; pinned posts lead the feed out of date order and are skipped
+            known = self.sync_archive(url) if sync else set()
+            limit = INSTAGRAM_SYNC_LIMIT if sync else 10  # Limit to 10 recent posts
+            
+            count = 0
+            for post in profile.get_posts():
+                if count >= limit:
+                    break
+                if f'instagram {post.mediaid}' in known:
+                    if post.is_pinned:
+                        continue
+                    break
+                loader.download_post(post, target=username)
+                count += 1
+                progress.publish_current({'type': 'item', 'url': url, 'item': post.shortcode, 'count': count})
+                if sync:
+                    known.add(f'instagram {post.mediaid}')
+            
+            return {
+                'status': 'success',
+                'message': f'Downloaded {count} recent posts from {username}',
+                'type': 'profile'
+            }
     
-    def download_tiktok_content(self, url, path):
+    def download_tiktok_content(self, url, path, sync=False, quality=None):
         """Download TikTok videos"""
         try:
             ydl_opts = {
                 'outtmpl': os.path.join(path, 'TikTok_%(uploader)s_%(title)s.%(ext)s'),
                 'format': 'best',
+                **self.transfer_options('tiktok'),
+                **self.sync_options(url, sync),
+                **self.format_options(quality),
             }
             
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=True)
+            with extractor_pool.youtube_dl('tiktok', ydl_opts) as ydl:
+                info = self.extract_info(ydl, url, sync=sync)
                 return {
                     'status': 'success',
                     'message': 'TikTok video downloaded successfully!',
@@ -186,16 +1425,19 @@ class UniversalDownloader:
         except Exception as e:
             return {'status': 'error', 'message': f'TikTok error: {str(e)}'}
     
-    def download_twitter_content(self, url, path):
+    def download_twitter_content(self, url, path, sync=False, quality=None):
         """Download Twitter/X videos, images, threads"""
         try:
             ydl_opts = {
                 'outtmpl': os.path.join(path, 'Twitter_%(uploader)s_%(title)s.%(ext)s'),
                 'writesubtitles': True,
+                **self.transfer_options('twitter'),
+                **self.sync_options(url, sync),
+                **self.format_options(quality),
             }
             
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=True)
+            with extractor_pool.youtube_dl('twitter', ydl_opts) as ydl:
+                info = self.extract_info(ydl, url, sync=sync)
                 return {
                     'status': 'success',
                     'message': 'Twitter content downloaded successfully!',
@@ -206,16 +1448,19 @@ class UniversalDownloader:
         except Exception as e:
             return {'status': 'error', 'message': f'Twitter error: {str(e)}'}
     
-    def download_facebook_content(self, url, path):
+    def download_facebook_content(self, url, path, sync=False, quality=None):
         """Download Facebook videos, posts"""
         try:
             ydl_opts = {
                 'outtmpl': os.path.join(path, 'Facebook_%(title)s.%(ext)s'),
                 'format': 'best',
+                **self.transfer_options('facebook'),
+                **self.sync_options(url, sync),
+                **self.format_options(quality),
             }
             
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=True)
+            with extractor_pool.youtube_dl('facebook', ydl_opts) as ydl:
+                info = self.extract_info(ydl, url, sync=sync)
                 return {
                     'status': 'success',
                     'message': 'Facebook content downloaded successfully!',
@@ -225,15 +1470,18 @@ class UniversalDownloader:
         except Exception as e:
             return {'status': 'error', 'message': f'Facebook error: {str(e)}'}
     
-    def download_reddit_content(self, url, path):
+    def download_reddit_content(self, url, path, sync=False, quality=None):
         """Download Reddit videos, images, gifs"""
         try:
             ydl_opts = {
                 'outtmpl': os.path.join(path, 'Reddit_%(title)s.%(ext)s'),
+                **self.transfer_options('reddit'),
+                **self.sync_options(url, sync),
+                **self.format_options(quality),
             }
             
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=True)
+            with extractor_pool.youtube_dl('reddit', ydl_opts) as ydl:
+                info = self.extract_info(ydl, url, sync=sync)
                 return {
                     'status': 'success',
                     'message': 'Reddit content downloaded successfully!',
@@ -243,16 +1491,19 @@ class UniversalDownloader:
         except Exception as e:
             return {'status': 'error', 'message': f'Reddit error: {str(e)}'}
     
-    def download_generic_content(self, url, path):
+    def download_generic_content(self, url, path, sync=False, quality=None):
         """Download from any supported platform using yt-dlp"""
         try:
             ydl_opts = {
                 'outtmpl': os.path.join(path, '%(extractor)s_%(title)s.%(ext)s'),
                 'format': 'best',
+                **self.transfer_options(self.detect_platform(url)),
+                **self.sync_options(url, sync),
+                **self.format_options(quality),
             }
             
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=True)
+            with extractor_pool.youtube_dl('generic', ydl_opts) as ydl:
+                info = self.extract_info(ydl, url, sync=sync)
                 return {
                     'status': 'success',
                     'message': 'Content downloaded successfully!',
@@ -263,6 +1514,213 @@ class UniversalDownloader:
         except Exception as e:
             return {'status': 'error', 'message': f'Download error: {str(e)}'}
     
+    def sync_archive(self, url):
+        """Archive of the media ids already fetched from this source"""
+        key = hashlib.sha1(canonicalize_url(url).encode()).hexdigest()[:16]
+        return SyncArchive(f'{self.detect_platform(url)}_{key}', job_store)
+    
+    def format_options(self, quality):
+        """Format selection for a quality profile; None keeps the platform default"""
+        return dict(QUALITY_PROFILES[quality]) if quality else {}
+    
+    def sync_options(self, url, sync):
+        """yt-dlp options that skip archived entries and stop at the first one"""
+        if not sync:
+            return {}
+        return {
+            'download_archive': self.sync_archive(url),
+            'break_on_existing': True,
+            'lazy_playlist': True,
+        }
+    
+    def transfer_options(self, platform):
+        """yt-dlp options for resumable, segmented transfers on platform"""
+        segments = PLATFORM_SEGMENTS.get(platform, PLATFORM_SEGMENTS.get('default', 1))
+        opts = {
+            'continuedl': True,
+            'retries': 10,
+            'fragment_retries': 10,
+            'concurrent_fragment_downloads': segments,
+            'http_chunk_size': HTTP_CHUNK_SIZE,
+        }
+        if segments > 1 and ARIA2C:
+            opts['external_downloader'] = {'http': 'aria2c'}
+            opts['external_downloader_args'] = {
+                'aria2c': ['-x', str(segments), '-s', str(segments), '-k', '1M']
+            }
+        return opts
+    
+    def extract_info(self, ydl, url, download=True, sync=False):
+        """ydl.extract_info that reuses a cached info dict for the same canonical URL
+
+        In sync mode the cache is bypassed so the listing is fresh, and
+        reaching an already archived entry ends the run early.
+        """
+        platform = self.detect_platform(url)
+        run = ydl.run = DownloadRun(platform, url)
+        try:
+            if download:
+                dedup_store.attach(ydl)
+            if sync:
+                try:
+                    return ydl.extract_info(url, download=download)
+                except yt_dlp.utils.ExistingVideoReached:
+                    # Everything from here on was fetched by an earlier sync
+                    return {'_type': 'playlist', 'entries': [], 'title': 'Up to date', 'webpage_url': url}
+            cached = metadata_cache.get(url)
+            if cached is not None:
+                metrics.inc('downloader_metadata_cache_total', result='hit')
+                try:
+                    return ydl.process_ie_result(cached, download=download)
+                except yt_dlp.utils.DownloadError:
+                    # Media URLs in the cached dict have probably expired
+                    metadata_cache.delete(url)
+            metrics.inc('downloader_metadata_cache_total', result='miss')
+            
+            info = self.extract_unprocessed(ydl, url)
+            return ydl.process_ie_result(info, download=download) if info else info
+        finally:
+            run.tracker.mark_extracted()
+            ydl.run = None
+    
+    def extract_unprocessed(self, ydl, url):
+        """Run the extractor for url and cache its result before format selection
+
+        Only single videos are cached; playlist entries may be lazy and
+        url results still point at another extractor.
+        """
+        info = ydl.extract_info(url, download=False, process=False)
+        if info and info.get('_type', 'video') == 'video':
+            metadata_cache.set(url, ydl.sanitize_info(info))
+        return info
+    
+    def get_info(self, url):
+        """Return (info, cached) for url without downloading any media"""
+        ydl_opts = {'quiet': True, 'skip_download': True}
+        if self.detect_platform(url) == 'youtube':
+            ydl_opts['cookiefile'] = os.path.join(os.getcwd(), 'cookies.txt')
+        with extractor_pool.youtube_dl('metadata', ydl_opts) as ydl:
+            info = metadata_cache.get(url)
+            cached = info is not None
+            if not cached:
+                info = self.extract_unprocessed(ydl, url)
+                if not info:
+                    return None, False
+            return ydl.sanitize_info(ydl.process_ie_result(info, download=False)), cached
+    
+    def get_metadata(self, url):
+        """Return metadata for url without downloading any media"""
+        info, cached = self.get_info(url)
+        if not info:
+            return {'status': 'error', 'message': 'No information extracted from the URL'}
+        
+        result = {
+            'status': 'success',
+            'cached': cached,
+            'id': info.get('id'),
+            'title': info.get('title', 'Unknown'),
+            'uploader': info.get('uploader', 'Unknown'),
+            'thumbnail': info.get('thumbnail'),
+            'duration': info.get('duration'),
+            'extractor': info.get('extractor'),
+            'webpage_url': info.get('webpage_url', url),
+            'type': 'playlist' if info.get('_type') == 'playlist' else 'video'
+        }
+        if result['type'] == 'playlist':
+            result['entry_count'] = len(info.get('entries') or [])
+        return result
+    
+    @staticmethod
+    def estimate_size(fmt, duration):
+        """Exact or approximate size of a format in bytes, from bitrate if needed"""
+        size = fmt.get('filesize') or fmt.get('filesize_approx')
+        if not size and fmt.get('tbr') and duration:
+            size = fmt['tbr'] * 1000 / 8 * duration
+        return int(size) if size else None
+    
+    def list_formats(self, url):
+        """Available formats with estimated sizes, and what each quality profile would fetch"""
+        info, cached = self.get_info(url)
+        if not info:
+            return {'status': 'error', 'message': 'No information extracted from the URL'}
+        if info.get('_type') == 'playlist':
+            return {'status': 'error', 'message': 'Formats are listed per video; pass a single video URL'}
+        
+        duration = info.get('duration')
+        formats = info.get('formats') or [info]
+        listed = [{
+            'format_id': f.get('format_id'),
+            'ext': f.get('ext'),
+            'resolution': f.get('resolution') or yt_dlp.YoutubeDL.format_resolution(f),
+            'height': f.get('height'),
+            'fps': f.get('fps'),
+            'vcodec': f.get('vcodec'),
+            'acodec': f.get('acodec'),
+            'tbr': f.get('tbr'),
+            'protocol': f.get('protocol'),
+            'estimated_size': self.estimate_size(f, duration)
+        } for f in formats]
+        
+        # Run yt-dlp's own selector so the estimates match what would download
+        ctx = {
+            'formats': formats,
+            'has_merged_format': any('none' not in (f.get('acodec'), f.get('vcodec')) for f in formats),
+            'incomplete_formats': (all(f.get('vcodec') == 'none' for f in formats) or
+                                   all(f.get('acodec') == 'none' for f in formats)),
+        }
+        profiles = {}
+        with extractor_pool.youtube_dl('metadata', {'quiet': True, 'skip_download': True}) as ydl:
+            for quality, options in QUALITY_PROFILES.items():
+                try:
+                    selected = next(iter(ydl.build_format_selector(options['format'])(dict(ctx))), None)
+                except Exception:
+                    selected = None
+                if not selected:
+                    profiles[quality] = None
+                    continue
+                parts = selected.get('requested_formats') or [selected]
+                sizes = [self.estimate_size(part, duration) for part in parts]
+                profiles[quality] = {
+                    'format_id': selected.get('format_id'),
+                    'ext': options.get('merge_output_format') or selected.get('ext'),
+                    'resolution': selected.get('resolution') or yt_dlp.YoutubeDL.format_resolution(selected),
+                    'needs_merge': len(parts) > 1,
+                    'estimated_size': sum(sizes) if all(sizes) else None
+                }
+        
+        return {
+            'status': 'success',
+            'cached': cached,
+            'title': info.get('title', 'Unknown'),
+            'duration': duration,
+            'formats': listed,
+            'profiles': profiles
+        }
+    
+    def resolve_stream(self, url):
+        """Pick a single, unmerged format for url and return its direct media URL"""
+        ydl_opts = {'quiet': True, 'skip_download': True, 'format': STREAM_FORMAT}
+        if self.detect_platform(url) == 'youtube':
+            ydl_opts['cookiefile'] = os.path.join(os.getcwd(), 'cookies.txt')
+        with extractor_pool.youtube_dl('stream', ydl_opts) as ydl:
+            info = self.extract_info(ydl, url, download=False)
+        
+        if not info:
+            return {'status': 'error', 'message': 'No information extracted from the URL'}
+        if info.get('_type') == 'playlist' or 'requested_formats' in info:
+            return {'status': 'error', 'message': 'Streaming needs a single-file format; use /download instead'}
+        if not info.get('url') or not str(info.get('protocol', 'https')).startswith('http'):
+            return {'status': 'error', 'message': 'No directly streamable format available; use /download instead'}
+        
+        return {
+            'status': 'success',
+            'url': info['url'],
+            'headers': info.get('http_headers') or {},
+            'title': info.get('title', 'video'),
+            'ext': info.get('ext', 'mp4'),
+            'filesize': info.get('filesize')
+        }
+    
     def extract_instagram_shortcode(self, url):
         """Extract shortcode from Instagram URL"""
         patterns = [
@@ -283,38 +1741,1187 @@ class UniversalDownloader:
             return match.group(1)
         return None
     
-    def download_content(self, url, custom_path=None):
-        """Main download function"""
+    def create_download_folder(self, path, platform):
+        """Create a fresh timestamped folder, never reusing one a concurrent job holds
+
+        With a shared catalog the node id is part of the name, so items from
+        different nodes never share a name (the catalog and redirects go by name).
+        """
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        stem = f"{platform}_{timestamp}"
+        if JOB_STORE or CATALOG_DB:
+            stem = f"{platform}_{secure_filename(NODE_ID)}_{timestamp}"
+        folder_name = stem
+        suffix = 1
+        while True:
+            download_folder = os.path.join(path, folder_name)
+            try:
+                os.makedirs(download_folder)
+                return download_folder
+            except FileExistsError:
+                suffix += 1
+                folder_name = f"{stem}_{suffix}"
+    
+    def inflight_key(self, url, custom_path=None, sync=False, quality=None):
+        """Downloads with equal keys are coalesced into one"""
+        return (canonicalize_url(url), os.path.abspath(custom_path or DOWNLOAD_DIR), bool(sync), quality)
+    
+    def download_content(self, url, custom_path=None, sync=False, quality=None, flight=None):
+        """Main download function
+
+        With sync=True only entries missing from the source's archive are
+        fetched (incremental playlist, channel and profile mirroring).
+        quality picks one of QUALITY_PROFILES instead of the platform default.
+        Concurrent calls for the same canonical URL and options share one
+        download; the extra callers get its result with coalesced=True.
+        flight is a (call, leader) pair already claimed by admit_download.
+        """
         path = custom_path or DOWNLOAD_DIR
-        platform = self.detect_platform(url)
+        with metrics.timed('detect', 'all'):
+            platform = self.detect_platform(url)
         
-        # Create timestamped folder for this download
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        download_folder = os.path.join(path, f"{platform}_{timestamp}")
-        os.makedirs(download_folder, exist_ok=True)
+        call, leader = flight or self.inflight.claim(self.inflight_key(url, path, sync, quality))
+        if leader:
+            return self.inflight.run(call, lambda: self.run_download(url, path, platform, sync, quality))
+        result = self.inflight.wait(call)
+        metrics.inc('downloader_coalesced_total', stage='download', platform=platform)
+        result['coalesced'] = True
+        return result
+    
+    def run_download(self, url, path, platform, sync=False, quality=None):
+        """Claim a folder for url and download into it
+
+        Rate limits are checked before a download starts (admit_download),
+        so this never waits out a platform's backoff.
+        """
+        # Resume an unfinished folder for this URL and quality, or create a timestamped one
+        with metrics.timed('filesystem', platform):
+            download_folder = resume_index.claim(url, path, lambda: self.create_download_folder(path, platform),
+                                                 quality)
+            folder_name = os.path.basename(download_folder)
+            storage.pin(folder_name)
+            # The folder may have been evicted between the claim and the pin
+            os.makedirs(download_folder, exist_ok=True)
+        
+        archived = len(self.sync_archive(url)) if sync else 0
         
         try:
-            if platform == 'youtube':
-                return self.download_youtube_content(url, download_folder)
-            elif platform == 'instagram':
-                return self.download_instagram_content(url, download_folder)
-            elif platform == 'tiktok':
-                return self.download_tiktok_content(url, download_folder)
-            elif platform == 'twitter':
-                return self.download_twitter_content(url, download_folder)
-            elif platform == 'facebook':
-                return self.download_facebook_content(url, download_folder)
-            elif platform == 'reddit':
-                return self.download_reddit_content(url, download_folder)
-            else:
-                # Try generic download for other platforms
-                return self.download_generic_content(url, download_folder)
-                
-        except Exception as e:
-            return {'status': 'error', 'message': f'Unexpected error: {str(e)}'}
+            return self.finish_download(url, path, platform, download_folder, sync, archived, quality)
+        finally:
+            storage.unpin(folder_name)
+            storage.request_check()
+    
+    def finish_download(self, url, path, platform, download_folder, sync, archived, quality=None):
+        """Run the platform download into download_folder and record the outcome"""
+        try:
+            with metrics.timed('download', platform):
+                if platform == 'youtube':
+                    result = self.download_youtube_content(url, download_folder, sync, quality)
+                elif platform == 'instagram':
+                    result = self.download_instagram_content(url, download_folder, sync, quality)
+                elif platform == 'tiktok':
+                    result = self.download_tiktok_content(url, download_folder, sync, quality)
+                elif platform == 'twitter':
+                    result = self.download_twitter_content(url, download_folder, sync, quality)
+                elif platform == 'facebook':
+                    result = self.download_facebook_content(url, download_folder, sync, quality)
+                elif platform == 'reddit':
+                    result = self.download_reddit_content(url, download_folder, sync, quality)
+                else:
+                    # Try generic download for other platforms
+                    result = self.download_generic_content(url, download_folder, sync, quality)
+                
+        except Exception as e:
+            result = {'status': 'error', 'message': f'Unexpected error: {str(e)}'}
+        
+        if sync and result.get('status') == 'success':
+            result['new_items'] = len(self.sync_archive(url)) - archived
+            result['message'] = f"Synced {result['new_items']} new items"
+        
+        scheduler.report(platform, result)
+        metrics.inc('downloader_downloads_total', platform=platform, status=result.get('status', 'error'))
+        with metrics.timed('filesystem', platform):
+            resume_index.release(url, download_folder, result.get('status') == 'success', quality)
+            if sync and result.get('status') == 'success' and not os.listdir(download_folder):
+                # Nothing new since the last sync; don't leave an empty folder behind
+                os.rmdir(download_folder)
+                result['folder'] = None
+                return result
+            result['folder'] = os.path.basename(download_folder)
+            if os.path.abspath(path) == os.path.abspath(DOWNLOAD_DIR):
+                catalog.record(result['folder'], platform, result.get('title'))
+                thumbnails.submit(result['folder'], result.get('thumbnail'))
+        return result
+
+class ProgressHub:
+    """Per-job progress event log that SSE clients can follow
+
+    Worker threads bind the job they run; yt-dlp progress hooks and
+    instaloader item callbacks publish into the bound job's log.
+    """
+
+    def __init__(self, history=PROGRESS_HISTORY):
+        self.history = history
+        self.events = {}
+        self.sequence = {}
+        # job_id -> when its log was closed
+        self.closed = {}
+        self.cond = threading.Condition()
+        self.local = threading.local()
+        # job_id -> {(loop, asyncio.Event)} for ASGI subscribers
+        self.async_waiters = {}
+
+    def bind(self, job_id):
+        self.local.job_id = job_id
+
+    def current_job(self):
+        return getattr(self.local, 'job_id', None)
+
+    def publish(self, job_id, event):
+        if not job_id:
+            return
+        with self.cond:
+            seq = self.sequence.get(job_id, 0) + 1
+            self.sequence[job_id] = seq
+            log = self.events.setdefault(job_id, collections.deque(maxlen=self.history))
+            log.append(dict(event, id=seq, time=time.time()))
+            self.notify(job_id)
+
+    def publish_current(self, event):
+        self.publish(self.current_job(), event)
+
+    def close(self, job_id):
+        with self.cond:
+            self.closed[job_id] = time.time()
+            self.notify(job_id)
+
+    def notify(self, job_id):
+        """Wake threads and coroutines waiting on job_id; call with cond held"""
+        self.cond.notify_all()
+        for loop, ready in self.async_waiters.get(job_id, ()):
+            loop.call_soon_threadsafe(ready.set)
+
+    def discard(self, job_id):
+        with self.cond:
+            self.events.pop(job_id, None)
+            self.sequence.pop(job_id, None)
+            self.closed.pop(job_id, None)
+
+    def prune(self, ttl=JOB_TTL):
+        """Drop the logs of jobs closed more than ttl seconds ago"""
+        cutoff = time.time() - ttl
+        with self.cond:
+            expired = [job_id for job_id, closed in self.closed.items() if closed < cutoff]
+        for job_id in expired:
+            self.discard(job_id)
+
+    def wait(self, job_id, after=0, timeout=15):
+        """Return (events newer than after, closed) waiting up to timeout for news"""
+        with self.cond:
+            def news():
+                return self.sequence.get(job_id, 0) > after or job_id in self.closed
+            self.cond.wait_for(news, timeout)
+            return self.since(job_id, after)
+
+    async def wait_async(self, job_id, after=0, timeout=15):
+        """Coroutine version of wait() that holds no thread while idle"""
+        ready = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), ready)
+        with self.cond:
+            if self.sequence.get(job_id, 0) > after or job_id in self.closed:
+                return self.since(job_id, after)
+            self.async_waiters.setdefault(job_id, set()).add(waiter)
+        try:
+            await asyncio.wait_for(ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self.cond:
+                waiters = self.async_waiters.get(job_id, set())
+                waiters.discard(waiter)
+                if not waiters:
+                    self.async_waiters.pop(job_id, None)
+        with self.cond:
+            return self.since(job_id, after)
+
+    def since(self, job_id, after):
+        events = [e for e in self.events.get(job_id, ()) if e['id'] > after]
+        return events, job_id in self.closed
+
+    def hook(self, job_id, url):
+        """yt-dlp progress hook publishing bytes done, speed and ETA for job_id"""
+        last = {}
+
+        def report(d):
+            key = d.get('filename')
+            now = time.monotonic()
+            if d.get('status') == 'downloading' and now - last.get(key, 0) < PROGRESS_INTERVAL:
+                return
+            last[key] = now
+            done = d.get('downloaded_bytes') or 0
+            total = d.get('total_bytes') or d.get('total_bytes_estimate')
+            self.publish(job_id, {
+                'type': 'progress',
+                'url': url,
+                'status': d.get('status'),
+                'filename': os.path.basename(key or ''),
+                'downloaded_bytes': done,
+                'total_bytes': total,
+                'percent': round(done * 100 / total, 1) if total else None,
+                'speed': d.get('speed'),
+                'eta': d.get('eta'),
+            })
+        return report
+
+    def reporter(self, url):
+        """Progress hook for a transfer of url in the current job, if there is one"""
+        job_id = self.current_job()
+        return self.hook(job_id, url) if job_id else None
+
+
+def sse_message(event):
+    """Format a progress event as a server-sent event"""
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+SSE_END = 'event: end\ndata: {}\n\n'
+# Keeps proxies from timing out an idle stream
+SSE_KEEPALIVE = ': keepalive\n\n'
+
+
+class TokenBucket:
+    """Token bucket that hands out reservations, so waiters are served in order"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, amount=1):
+        """Take amount tokens and return how long the caller must wait"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            return max(0.0, -self.tokens / self.rate)
+
+    def try_reserve(self, amount=1):
+        """Take amount tokens if they are there; otherwise return the seconds until they are"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0.0
+            return (amount - self.tokens) / self.rate
+
+    def consume(self, amount=1):
+        delay = self.reserve(amount)
+        if delay:
+            time.sleep(delay)
+
+
+class SharedTokenBucket(TokenBucket):
+    """TokenBucket whose tokens live in a JobStore, so every node draws on one budget"""
+
+    def __init__(self, store, name, rate, capacity=None):
+        super().__init__(rate, capacity)
+        self.store = store
+        self.name = name
+
+    def reserve(self, amount=1):
+        return self.store.take_tokens(self.name, self.rate, self.capacity, amount, force=True)
+
+    def try_reserve(self, amount=1):
+        return self.store.take_tokens(self.name, self.rate, self.capacity, amount, force=False)
+
+
+class RateScheduler:
+    """Per-platform request and bandwidth buckets with adaptive backoff
+
+    Given a JobStore, request tokens and backoff are kept there and apply
+    across nodes; bandwidth buckets always stay per process, since they are
+    drawn on for every chunk received.
+    """
+
+    RATE_LIMITED = re.compile(r'\b429\b|too many requests|checkpoint|rate.?limit|please wait a few minutes|login_required',
+                              re.IGNORECASE)
+
+    def __init__(self, request_rates=PLATFORM_REQUEST_RATE, bandwidth=PLATFORM_BANDWIDTH, store=None):
+        self.request_rates = request_rates
+        self.bandwidth = bandwidth
+        self.store = store
+        self.request_buckets = {}
+        self.byte_buckets = {}
+        self.backoff = {}
+        self.lock = threading.Lock()
+
+    def bucket(self, buckets, limits, platform, shared=False):
+        rate = limits.get(platform, limits.get('default', 0))
+        if not rate:
+            return None
+        with self.lock:
+            if platform not in buckets:
+                buckets[platform] = (SharedTokenBucket(self.store, f'requests:{platform}', rate)
+                                     if shared and self.store else TokenBucket(rate))
+            return buckets[platform]
+
+    def backoff_state(self):
+        """platform -> (level, until), from the JobStore when there is one"""
+        if self.store:
+            return self.store.backoffs()
+        with self.lock:
+            return dict(self.backoff)
+
+    def backoff_remaining(self, platform):
+        level, until = self.backoff_state().get(platform, (0, 0))
+        return max(0.0, until - time.time())
+
+    def wait_for_request(self, platform):
+        """Block until platform is out of backoff and has a request token"""
+        delay = self.backoff_remaining(platform)
+        if delay:
+            time.sleep(delay)
+        bucket = self.bucket(self.request_buckets, self.request_rates, platform, shared=True)
+        if bucket:
+            bucket.consume()
+
+    def try_request(self, platform):
+        """Non-blocking wait_for_request: take a token and return 0, or return the seconds to wait"""
+        delay = self.backoff_remaining(platform)
+        if delay:
+            return delay
+        bucket = self.bucket(self.request_buckets, self.request_rates, platform, shared=True)
+        return bucket.try_reserve() if bucket else 0.0
+
+    def throttle(self, platform):
+        """Progress hook that holds transfers to the platform's byte rate"""
+        bucket = self.bucket(self.byte_buckets, self.bandwidth, platform)
+        if not bucket:
+            return None
+        seen = {}
+
+        def hook(d):
+            if d.get('status') != 'downloading':
+                return
+            done = d.get('downloaded_bytes') or 0
+            key = d.get('tmpfilename') or d.get('filename')
+            delta = done - seen.get(key, 0)
+            seen[key] = done
+            if delta > 0:
+                bucket.consume(delta)
+        return hook
+
+    def report(self, platform, result):
+        """Back off after a rate-limit failure, relax again after successes"""
+        with self.lock:
+            level, until = (self.store.backoffs() if self.store else self.backoff).get(platform, (0, 0))
+            if result.get('status') == 'error' and self.RATE_LIMITED.search(result.get('message', '')):
+                level += 1
+                until = time.time() + min(RATE_LIMIT_BACKOFF_MAX, RATE_LIMIT_BACKOFF * 2 ** (level - 1))
+                metrics.inc('downloader_rate_limited_total', platform=platform)
+            elif result.get('status') == 'success':
+                level = max(0, level - 1)
+            else:
+                return
+            if self.store:
+                # Last writer wins between nodes; a lost step only shortens one cool-down
+                self.store.set_backoff(platform, level, until)
+            else:
+                self.backoff[platform] = (level, until)
+
+    def penalize(self, platform):
+        self.report(platform, {'status': 'error', 'message': '429'})
+
+    def backoffs(self):
+        now = time.time()
+        return {platform: max(0.0, until - now) for platform, (level, until) in self.backoff_state().items()}
+
+
+@functools.lru_cache(maxsize=None)
+def scheduler_rate_controller():
+    """RateController class routing instaloader's own query pacing through the shared scheduler
+
+    Built on first use, since subclassing needs instaloader imported.
+    """
+
+    class SchedulerRateController(instaloader.RateController):
+        def wait_before_query(self, query_type):
+            scheduler.wait_for_request('instagram')
+            super().wait_before_query(query_type)
+
+        def handle_429(self, query_type):
+            scheduler.penalize('instagram')
+            super().handle_429(query_type)
+
+    return SchedulerRateController
+
+
+class FairQueue:
+    """FIFO per owner, round-robin between owners, so one user's backlog can't starve others"""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.queues = {}
+        self.owners = collections.deque()
+        self.size = 0
+
+    def put(self, item, owner='anonymous'):
+        with self.cond:
+            if owner not in self.queues:
+                self.queues[owner] = collections.deque()
+                self.owners.append(owner)
+            self.queues[owner].append(item)
+            self.size += 1
+            self.cond.notify()
+
+    def get(self, admit=None):
+        """Return (item, ticket) for the next item admit() lets start
+
+        admit(item) returns (ticket, retry_in); items it refuses (ticket is
+        None) stay queued, so the caller never holds a job it cannot run.
+        Without admit every item starts with an empty ticket.
+        """
+        with self.cond:
+            while True:
+                retry = None
+                for owner in list(self.owners):
+                    items = self.queues[owner]
+                    for item in items:
+                        ticket, retry_in = admit(item) if admit else ({}, 0)
+                        if ticket is not None:
+                            items.remove(item)
+                            self.size -= 1
+                            self.owners.remove(owner)
+                            if items:
+                                self.owners.append(owner)
+                            else:
+                                del self.queues[owner]
+                            return item, ticket
+                        retry = retry_in if retry is None else min(retry, retry_in)
+                # Look again when the earliest refusal lapses, a job is put or wake() is called
+                self.cond.wait(min(retry, 1.0) if retry else (1.0 if self.size else None))
+
+    def wake(self):
+        with self.cond:
+            self.cond.notify_all()
+
+    def qsize(self):
+        with self.cond:
+            return self.size
+
+
+class JobQueue:
+    """Run download jobs on a pool of background worker threads"""
+
+    def __init__(self, workers=DOWNLOAD_WORKERS):
+        self.queue = FairQueue()
+        self.jobs = {}
+        # coalescing key -> id of the unfinished job submitted with it
+        self.inflight = {}
+        self.lock = threading.Lock()
+        self.workers = []
+        self.start_workers(max(1, workers))
+
+    def start_workers(self, count):
+        for i in range(count):
+            worker = threading.Thread(target=self.worker_loop, name=f'download-worker-{i}', daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def submit(self, kind, func, *args, key=None, **info):
+        """Queue func(*args) and return the new job record
+
+        While a job submitted with the same key is unfinished, that job's
+        record is returned instead, marked attached=True.
+        """
+        job_id = uuid.uuid4().hex
+        job = {
+            'id': job_id,
+            'kind': kind,
+            'state': 'queued',
+            'created': time.time(),
+            'started': None,
+            'finished': None,
+            'result': None,
+        }
+        job.update(info)
+        with self.lock:
+            self.prune()
+            current = self.jobs.get(self.inflight.get(key))
+            if current and not current['finished']:
+                return dict(current, attached=True)
+            self.jobs[job_id] = job
+            if key:
+                self.inflight[key] = job_id
+        self.queue.put((job_id, func, args), job.get('owner', 'anonymous'))
+        progress.publish(job_id, {'type': 'state', 'state': 'queued'})
+        return dict(job)
+
+    def get(self, job_id):
+        """Return a snapshot of a job, or None if unknown"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def update(self, job_id, **fields):
+        with self.lock:
+            if job_id in self.jobs:
+                self.jobs[job_id].update(fields)
+
+    def prune(self):
+        """Forget finished jobs older than JOB_TTL (caller holds the lock)"""
+        cutoff = time.time() - JOB_TTL
+        expired = [job_id for job_id, job in self.jobs.items()
+                   if job['finished'] and job['finished'] < cutoff]
+        for job_id in expired:
+            del self.jobs[job_id]
+            progress.discard(job_id)
+
+    def pending(self):
+        return self.queue.qsize()
+
+    def next_job(self):
+        """Block until a job may start and return (job_id, func, args, ticket)"""
+        (job_id, func, args), ticket = self.queue.get(lambda item: admit_job(item[1].__name__, item[2]))
+        return job_id, func, args, ticket
+
+    def wake(self):
+        """Re-check queued jobs that were refused admission"""
+        self.queue.wake()
+
+    def finish(self, job_id, state, result):
+        with self.lock:
+            for key in [key for key, running in self.inflight.items() if running == job_id]:
+                del self.inflight[key]
+        self.update(job_id, state=state, finished=time.time(), result=result)
+
+    def worker_loop(self):
+        while True:
+            job_id, func, args, ticket = self.next_job()
+            started = time.time()
+            self.update(job_id, state='running', started=started)
+            progress.bind(job_id)
+            progress.publish(job_id, {'type': 'state', 'state': 'running'})
+            job = self.get(job_id)
+            if job:
+                metrics.observe('downloader_job_wait_seconds', started - job['created'], kind=job['kind'])
+            try:
+                # A job body given a ticket owns what it holds
+                result = func(*args, ticket=ticket) if ticket else func(*args)
+                state = 'failed' if isinstance(result, dict) and result.get('status') == 'error' else 'finished'
+            except Exception as e:
+                result = {'status': 'error', 'message': f'Worker error: {str(e)}'}
+                state = 'failed'
+            self.finish(job_id, state, result)
+            progress.publish(job_id, {'type': 'state', 'state': state})
+            progress.close(job_id)
+            progress.bind(None)
+
+
+class JobStore(abc.ABC):
+    """Storage behind SharedJobQueue, shared by every node
+
+    A backend keeps job rows (as returned by get()) and must make lease()
+    and finish() atomic compare-and-set operations across nodes; the queue
+    builds claiming, retries and heartbeats on top of them.
+    """
+
+    @abc.abstractmethod
+    def add(self, job, key=None):
+        """Insert job unless an unfinished job has key; return that job's id, else None"""
+
+    @abc.abstractmethod
+    def get(self, job_id):
+        ...
+
+    @abc.abstractmethod
+    def update(self, job_id, **fields):
+        ...
+
+    @abc.abstractmethod
+    def prune(self, cutoff):
+        """Delete jobs finished before cutoff and return their ids"""
+
+    @abc.abstractmethod
+    def pending(self):
+        ...
+
+    @abc.abstractmethod
+    def candidates(self, now, limit=100):
+        """(id, func, args, attempts) of claimable jobs, owners with the fewest running jobs first"""
+
+    @abc.abstractmethod
+    def lease(self, job_id, node, worker, until, now):
+        """Mark a claimable job running for worker; False if another worker got it first"""
+
+    @abc.abstractmethod
+    def renew(self, worker, job_ids, until):
+        ...
+
+    @abc.abstractmethod
+    def finish(self, job_id, worker, state, result):
+        """Record the outcome, unless worker's lease was taken over"""
+
+    @abc.abstractmethod
+    def archive_entries(self, source):
+        """Media ids recorded for a /sync source (see SyncArchive)"""
+
+    @abc.abstractmethod
+    def archive_add(self, source, entry):
+        ...
+
+    @abc.abstractmethod
+    def take_tokens(self, name, rate, capacity, amount, force):
+        """Draw amount from a shared token bucket and return the seconds to wait
+
+        With force the tokens are taken regardless (the caller then waits);
+        otherwise only when they are all there.
+        """
+
+    @abc.abstractmethod
+    def backoffs(self):
+        """platform -> (level, until) of the shared rate-limit backoff"""
+
+    @abc.abstractmethod
+    def set_backoff(self, platform, level, until):
+        ...
+
+
+class SqliteJobStore(JobStore):
+    """JobStore in one SQLite file, for tests and nodes on a single host
+
+    SQLite's file locking is not reliable on network filesystems, so this is
+    not a store for nodes on different machines.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self.db.execute('''CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            state TEXT NOT NULL,
+            owner TEXT,
+            func TEXT NOT NULL,
+            args TEXT NOT NULL,
+            info TEXT NOT NULL,
+            node TEXT,
+            worker TEXT,
+            lease_until REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created REAL NOT NULL,
+            started REAL,
+            finished REAL,
+            result TEXT,
+            key TEXT
+        )''')
+        if 'key' not in [row[1] for row in self.db.execute('PRAGMA table_info(jobs)')]:
+            self.db.execute('ALTER TABLE jobs ADD COLUMN key TEXT')
+        self.db.execute('CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, created)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key, state)')
+        self.db.execute('''CREATE TABLE IF NOT EXISTS sync_archive (
+            source TEXT NOT NULL,
+            entry TEXT NOT NULL,
+            PRIMARY KEY (source, entry)
+        )''')
+        self.db.execute('''CREATE TABLE IF NOT EXISTS rate_buckets (
+            name TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated REAL NOT NULL
+        )''')
+        self.db.execute('''CREATE TABLE IF NOT EXISTS backoff (
+            platform TEXT PRIMARY KEY,
+            level INTEGER NOT NULL,
+            until REAL NOT NULL
+        )''')
+
+    @contextmanager
+    def transaction(self):
+        """Serialize writers across processes with an immediate write lock"""
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                yield self.db
+            except Exception:
+                self.db.execute('ROLLBACK')
+                raise
+            self.db.execute('COMMIT')
+
+    def add(self, job, key=None):
+        info = {k: v for k, v in job.items() if k not in ('id', 'kind', 'func', 'args', 'created')}
+        with self.transaction() as db:
+            current = key and db.execute(
+                "SELECT id FROM jobs WHERE key = ? AND state IN ('queued', 'running') LIMIT 1", (key,)).fetchone()
+            if current:
+                return current[0]
+            db.execute('''INSERT INTO jobs (id, kind, state, owner, func, args, info, created, key)
+                VALUES (?, ?, 'queued', ?, ?, ?, ?, ?, ?)''',
+                (job['id'], job['kind'], info.get('owner', 'anonymous'), job['func'], json.dumps(job['args']),
+                 json.dumps(info), job['created'], key))
+        return None
+
+    def get(self, job_id):
+        with self.lock:
+            row = self.db.execute(
+                'SELECT id, kind, state, created, started, finished, result, info, node, attempts '
+                'FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if not row:
+            return None
+        job = dict(zip(('id', 'kind', 'state', 'created', 'started', 'finished', 'result'), row[:7]))
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        job.update(json.loads(row[7]))
+        job['node'], job['attempts'] = row[8], row[9]
+        return job
+
+    def update(self, job_id, **fields):
+        columns = [column for column in fields if column in ('state', 'started', 'finished', 'result')]
+        if not columns:
+            return
+        values = [json.dumps(fields[c], default=str) if c == 'result' else fields[c] for c in columns]
+        with self.transaction() as db:
+            db.execute(f"UPDATE jobs SET {', '.join(f'{c} = ?' for c in columns)} WHERE id = ?",
+                       values + [job_id])
+
+    def prune(self, cutoff):
+        with self.transaction() as db:
+            expired = [row[0] for row in db.execute('SELECT id FROM jobs WHERE finished < ?', (cutoff,))]
+            db.execute('DELETE FROM jobs WHERE finished < ?', (cutoff,))
+        return expired
+
+    def pending(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM jobs WHERE state = 'queued'").fetchone()[0]
+
+    def candidates(self, now, limit=100):
+        with self.lock:
+            rows = self.db.execute('''SELECT id, func, args, attempts FROM jobs AS j
+                WHERE state = 'queued' OR (state = 'running' AND lease_until < :now)
+                ORDER BY (SELECT COUNT(*) FROM jobs AS r WHERE r.owner = j.owner
+                          AND r.state = 'running' AND r.lease_until >= :now), created
+                LIMIT :limit''', {'now': now, 'limit': limit}).fetchall()
+        return [(job_id, func, tuple(json.loads(args)), attempts) for job_id, func, args, attempts in rows]
+
+    def lease(self, job_id, node, worker, until, now):
+        with self.transaction() as db:
+            cursor = db.execute('''UPDATE jobs SET state = 'running', node = ?, worker = ?, lease_until = ?,
+                attempts = attempts + 1
+                WHERE id = ? AND (state = 'queued' OR (state = 'running' AND lease_until < ?))''',
+                (node, worker, until, job_id, now))
+        return cursor.rowcount == 1
+
+    def renew(self, worker, job_ids, until):
+        with self.transaction() as db:
+            db.executemany('UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ?',
+                           [(until, job_id, worker) for job_id in job_ids])
+
+    def finish(self, job_id, worker, state, result):
+        with self.transaction() as db:
+            cursor = db.execute('''UPDATE jobs SET state = ?, finished = ?, result = ?, lease_until = NULL
+                WHERE id = ? AND worker = ?''',
+                (state, time.time(), json.dumps(result, default=str), job_id, worker))
+        return cursor.rowcount == 1
+
+    def archive_entries(self, source):
+        with self.lock:
+            return {row[0] for row in self.db.execute('SELECT entry FROM sync_archive WHERE source = ?', (source,))}
+
+    def archive_add(self, source, entry):
+        with self.transaction() as db:
+            db.execute('INSERT OR IGNORE INTO sync_archive (source, entry) VALUES (?, ?)', (source, entry))
+
+    def take_tokens(self, name, rate, capacity, amount, force):
+        now = time.time()
+        with self.transaction() as db:
+            row = db.execute('SELECT tokens, updated FROM rate_buckets WHERE name = ?', (name,)).fetchone()
+            tokens = capacity if row is None else min(capacity, row[0] + max(0.0, now - row[1]) * rate)
+            if tokens >= amount or force:
+                tokens -= amount
+                wait_for = max(0.0, -tokens / rate)
+            else:
+                wait_for = (amount - tokens) / rate
+            db.execute('INSERT OR REPLACE INTO rate_buckets (name, tokens, updated) VALUES (?, ?, ?)',
+                       (name, tokens, now))
+        return wait_for
+
+    def backoffs(self):
+        with self.lock:
+            return {platform: (level, until)
+                    for platform, level, until in self.db.execute('SELECT platform, level, until FROM backoff')}
+
+    def set_backoff(self, platform, level, until):
+        with self.transaction() as db:
+            db.execute('INSERT OR REPLACE INTO backoff (platform, level, until) VALUES (?, ?, ?)',
+                       (platform, level, until))
+
+
+# JOB_STORE URL schemes; a backend for another database registers here
+JOB_STORE_BACKENDS = {'sqlite': SqliteJobStore}
+
+
+def open_job_store(spec):
+    """Open the JobStore named by a JOB_STORE value ('sqlite:///path' or a bare path)"""
+    scheme, sep, rest = spec.partition('://')
+    if not sep:
+        scheme, rest = 'sqlite', spec
+    elif scheme == 'sqlite':
+        # sqlite:///relative.db and sqlite:////absolute.db, as in SQLAlchemy URLs
+        rest = rest[1:] if rest.startswith('/') else rest
+    if scheme not in JOB_STORE_BACKENDS:
+        raise ValueError(f'Unsupported JOB_STORE backend: {scheme}')
+    return JOB_STORE_BACKENDS[scheme](rest)
+
+
+class SharedJobQueue(JobQueue):
+    """JobQueue kept in a JobStore that several nodes share
+
+    Workers on every node claim queued jobs under a lease and write results
+    back, so any node can answer /jobs/<id>. A heartbeat renews the leases of
+    running jobs; a job whose lease runs out is claimed again by another
+    worker, up to JOB_MAX_ATTEMPTS runs. Owners with fewer running jobs are
+    served first, in place of FairQueue's round-robin.
+    """
+
+    # Job bodies workers may run; stored by name since jobs cross processes
+    FUNCTIONS = ('run_single_download', 'run_bulk_download')
+
+    def __init__(self, store, workers=DOWNLOAD_WORKERS, node=NODE_ID):
+        self.store = store
+        self.node = node
+        # Leases belong to this process; NODE_ID alone is reused after a restart
+        self.worker_id = f'{node}:{os.getpid()}'
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.running = set()
+        self.workers = []
+        if workers:
+            self.start_workers(workers)
+            threading.Thread(target=self.heartbeat_loop, name='job-heartbeat', daemon=True).start()
+
+    def submit(self, kind, func, *args, key=None, **info):
+        if func.__name__ not in self.FUNCTIONS:
+            raise ValueError(f'{func.__name__} cannot run as a shared job')
+        job_id = uuid.uuid4().hex
+        self.prune()
+        # Coalesce with an unfinished job from any node
+        current = self.store.add(dict(info, id=job_id, kind=kind, func=func.__name__, args=args,
+                                      created=time.time()), key)
+        if current:
+            return dict(self.get(current), attached=True)
+        self.wakeup.set()
+        progress.publish(job_id, {'type': 'state', 'state': 'queued'})
+        return self.get(job_id)
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def update(self, job_id, **fields):
+        self.store.update(job_id, **fields)
+
+    def prune(self):
+        """Forget finished jobs older than JOB_TTL"""
+        for job_id in self.store.prune(time.time() - JOB_TTL):
+            progress.discard(job_id)
+
+    def pending(self):
+        return self.store.pending()
+
+    def claim(self):
+        """Lease the next job that may start to this process; None if there is none"""
+        now = time.time()
+        for job_id, func, args, attempts in self.store.candidates(now):
+            if attempts >= JOB_MAX_ATTEMPTS:
+                # Its workers keep dying; stop handing it out
+                result = {'status': 'error', 'message': f'Job abandoned after {attempts} attempts'}
+                self.store.update(job_id, state='failed', finished=now, result=result)
+                continue
+            # Jobs refused admission stay queued for a later claim
+            ticket, retry_in = admit_job(func, args)
+            if ticket is None:
+                continue
+            try:
+                leased = self.store.lease(job_id, self.node, self.worker_id, now + JOB_LEASE, now)
+            except Exception:
+                release_ticket(ticket)
+                raise
+            if not leased:
+                # Another worker claimed it since candidates() was read
+                release_ticket(ticket)
+                continue
+            with self.lock:
+                self.running.add(job_id)
+            return job_id, globals()[func], args, ticket
+        return None
+
+    def next_job(self):
+        while True:
+            job = self.claim()
+            if job:
+                return job
+            self.wakeup.wait(JOB_POLL_INTERVAL)
+            self.wakeup.clear()
+
+    def wake(self):
+        self.wakeup.set()
+
+    def finish(self, job_id, state, result):
+        with self.lock:
+            self.running.discard(job_id)
+        # A worker whose lease was taken over leaves the result to the new run
+        self.store.finish(job_id, self.worker_id, state, result)
+
+    def heartbeat_loop(self):
+        while True:
+            time.sleep(JOB_LEASE / 3)
+            # Jobs run here are pruned from the store by whichever node
+            # submits next, so this node's own progress logs are aged out here
+            progress.prune()
+            with self.lock:
+                running = list(self.running)
+            if not running:
+                continue
+            try:
+                self.store.renew(self.worker_id, running, time.time() + JOB_LEASE)
+            except Exception as e:
+                print(f"Job heartbeat failed: {e}")
+
+
+class ConcurrencyLimiter:
+    """Process-wide global and per-platform caps on running downloads"""
+
+    def __init__(self, total=MAX_CONCURRENT_DOWNLOADS, per_platform=PLATFORM_CONCURRENCY):
+        self.total = total
+        self.per_platform = per_platform
+        self.running = {}
+        self.cond = threading.Condition()
+        # Called after every release, e.g. to re-check jobs waiting for a slot
+        self.listeners = []
+
+    def limit_for(self, platform):
+        return self.per_platform.get(platform, self.per_platform.get('default', 1))
+
+    def has_room(self, platform):
+        return (sum(self.running.values()) < self.total and
+                self.running.get(platform, 0) < self.limit_for(platform))
+
+    def try_acquire(self, platform):
+        """Take a slot for platform without blocking; return True on success"""
+        with self.cond:
+            if not self.has_room(platform):
+                return False
+            self.running[platform] = self.running.get(platform, 0) + 1
+            return True
+
+    def acquire(self, platform):
+        with self.cond:
+            self.cond.wait_for(lambda: self.has_room(platform))
+            self.running[platform] = self.running.get(platform, 0) + 1
+
+    def release(self, platform):
+        with self.cond:
+            self.running[platform] -= 1
+            self.cond.notify_all()
+        for listener in self.listeners:
+            listener()
+
+    def wait_for_release(self, timeout):
+        with self.cond:
+            self.cond.wait(timeout)
+
+    def active(self):
+        with self.cond:
+            return dict(self.running)
+
 
 # Initialize downloader
+metrics = Metrics()
+progress = ProgressHub()
+metrics.register('downloader_downloads_total', 'counter', 'Finished downloads by platform and outcome')
+metrics.register('downloader_stage_seconds', 'summary', 'Time spent per pipeline stage')
+metrics.register('downloader_bytes_total', 'counter', 'Bytes transferred from upstream')
+metrics.register('downloader_transfer_bytes_per_second', 'gauge', 'Speed of the last finished transfer')
+metrics.register('downloader_metadata_cache_total', 'counter', 'Metadata cache lookups by result')
+metrics.register('downloader_job_wait_seconds', 'summary', 'Time jobs spent queued before a worker picked them up')
+metrics.register('downloader_queue_depth', 'gauge', 'Jobs waiting for a worker')
+metrics.register('downloader_active_transfers', 'gauge', 'Downloads currently running')
+metrics.register('downloader_rate_limited_total', 'counter', 'Rate-limit responses (429, checkpoints) by platform')
+metrics.register('downloader_backoff_seconds', 'gauge', 'Remaining rate-limit cool-down by platform')
+metrics.register('downloader_evicted_bytes_total', 'counter', 'Bytes removed by quota eviction')
+metrics.register('downloader_storage_bytes', 'gauge', 'Catalogued size of DOWNLOAD_DIR')
+metrics.register('downloader_coalesced_total', 'counter', 'Requests served by a download already in flight')
+metadata_cache = MetadataCache()
+extractor_pool = ExtractorPool()
+dedup_store = DedupStore()
+catalog = DownloadCatalog(CATALOG_DB or None)
+thumbnails = ThumbnailGenerator()
+storage = StorageManager()
+resume_index = ResumeIndex()
+if catalog.count() == 0 or catalog.needs_rebuild:
+    # First start with an existing download directory, or a catalog from
+    # before per-file sizes were kept
+    catalog.rebuild()
 downloader = UniversalDownloader()
+job_store = open_job_store(JOB_STORE) if JOB_STORE else None
+if job_store:
+    jobs = SharedJobQueue(job_store, workers=0 if NODE_ROLE == 'web' else DOWNLOAD_WORKERS)
+else:
+    jobs = JobQueue()
+limiter = ConcurrencyLimiter()
+limiter.listeners.append(jobs.wake)
+scheduler = RateScheduler(store=job_store)
+if PRELOAD_EXTRACTORS:
+    preload_extractors()
+
+
+def collect_runtime_metrics(registry):
+    registry.set('downloader_queue_depth', jobs.pending())
+    registry.set('downloader_storage_bytes', catalog.total_size())
+    for platform, running in limiter.active().items():
+        registry.set('downloader_active_transfers', running, platform=platform)
+    for platform, remaining in scheduler.backoffs().items():
+        registry.set('downloader_backoff_seconds', remaining, platform=platform)
+
+
+metrics.collectors.append(collect_runtime_metrics)
+
+
+def admit_download(url, platform, sync=False, quality=None):
+    """Decide without blocking whether a download of url may start now
+
+    Returns (ticket, retry_in), and a ticket must be given back with
+    release_ticket. A download of the same URL already in flight is joined
+    without a slot or token. Otherwise the ticket holds a limiter slot and
+    leads the download; it is None while the platform has no free slot
+    (retry_in 0: wait for a release) or is backing off or out of request
+    tokens (retry_in says how long that lasts). Callers keep refused
+    downloads queued instead of sleeping on them.
+    """
+    key = downloader.inflight_key(url, None, sync, quality)
+    call = downloader.inflight.attach(key)
+    if call is not None:
+        return {'flight': (call, False)}, 0
+    retry_in = scheduler.backoff_remaining(platform)
+    if retry_in:
+        return None, retry_in
+    if not limiter.try_acquire(platform):
+        return None, 0
+    retry_in = scheduler.try_request(platform)
+    if retry_in:
+        limiter.release(platform)
+        return None, retry_in
+    # Lead the download now, so duplicates admitted before it starts join it
+    call, leader = downloader.inflight.claim(key)
+    if not leader:
+        limiter.release(platform)
+        return {'flight': (call, False)}, 0
+    return {'platform': platform, 'flight': (call, True)}, 0
+
+
+def release_ticket(ticket):
+    if ticket.get('platform'):
+        limiter.release(ticket['platform'])
+    if ticket.get('flight'):
+        call, leader = ticket['flight']
+        if leader:
+            downloader.inflight.abandon(call, 'Download was not started')
+
+
+def admit_job(func_name, args):
+    """admit_download for a queued job; only single downloads are gated here
+
+    Bulk and sync jobs start right away and admit each URL themselves.
+    """
+    if func_name == 'run_single_download':
+        url, sync, quality = args
+        return admit_download(url, downloader.detect_platform(url), sync, quality)
+    return {}, 0
+
+
+def run_single_download(url, sync=False, quality=None, ticket=None):
+    """Job body for /download; ticket comes from admit_download"""
+    platform = downloader.detect_platform(url)
+    if ticket is None:
+        # Called outside the job queue, so nothing admitted it yet
+        scheduler.wait_for_request(platform)
+        limiter.acquire(platform)
+        ticket = {'platform': platform}
+    try:
+        result = downloader.download_content(url, sync=sync, quality=quality, flight=ticket.get('flight'))
+    finally:
+        release_ticket(ticket)
+    result['platform'] = platform
+    return result
+
+
+def run_bulk_download(urls, sync=False, quality=None):
+    """Job body for /bulk-download
+
+    URLs are started as soon as both the global and their platform's cap
+    have room and the platform is not rate limited, so different hosts
+    download in parallel. Results keep the input order.
+    """
+    results = [None] * len(urls)
+    pending = [(index, url, downloader.detect_platform(url)) for index, url in enumerate(urls)]
+    running = {}
+    job_id = progress.current_job()
+
+    def run(url, ticket):
+        # Executor threads report progress to the bulk job that started them
+        progress.bind(job_id)
+        try:
+            return downloader.download_content(url, sync=sync, quality=quality, flight=ticket.get('flight'))
+        except Exception as e:
+            return {'status': 'error', 'message': f'Unexpected error: {str(e)}'}
+        finally:
+            release_ticket(ticket)
+
+    with ThreadPoolExecutor(max_workers=max(1, limiter.total)) as executor:
+        while pending or running:
+            # Start everything whose platform has a free slot, in input order
+            waiting = []
+            retry = 1.0
+            for index, url, platform in pending:
+                ticket, retry_in = admit_download(url, platform, sync, quality)
+                if ticket is not None:
+                    running[executor.submit(run, url, ticket)] = (index, url, platform)
+                    continue
+                retry = min(retry, retry_in or 1.0)
+                waiting.append((index, url, platform))
+            pending = waiting
+
+            if running:
+                done, _ = wait(running, timeout=1, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, url, platform = running.pop(future)
+                    result = future.result()
+                    result['url'] = url
+                    result['platform'] = platform
+                    results[index] = result
+                    progress.publish(job_id, {'type': 'item', 'url': url, 'status': result.get('status'),
+                                              'completed': sum(1 for r in results if r is not None), 'total': len(urls)})
+            else:
+                # Every slot is held by other jobs or every platform left is
+                # rate limited; wait for a slot or the earliest token
+                limiter.wait_for_release(retry)
+
+    return {
+        'status': 'success',
+        'message': f'Processed {len(results)} URLs',
+        'results': results
+    }
+
+
+def client_id():
+    """Identify the requesting user for fair scheduling
+
+    Clients can set X-Forwarded-For to anything, so only the address seen
+    through TRUSTED_PROXIES hops counts.
+    """
+    return request.remote_addr or 'anonymous'
 
 @app.route('/')
 def index():
@@ -323,7 +2930,7 @@ def index():
 
 @app.route('/download', methods=['POST'])
 def download():
-    """Handle download requests"""
+    """Queue a download and return its job id"""
     try:
         data = request.get_json()
         url = data.get('url', '').strip()
@@ -331,21 +2938,35 @@ def download():
         if not url:
             return jsonify({'status': 'error', 'message': 'URL is required'})
         
+        quality = data.get('quality') or None
+        if quality and quality not in QUALITY_PROFILES:
+            return jsonify({'status': 'error', 'message': f'Unknown quality; choose from {", ".join(QUALITY_PROFILES)}'})
+        
         # Detect platform automatically
         platform = downloader.detect_platform(url)
         
-        # Start download
-        result = downloader.download_content(url)
-        result['platform'] = platform
+        # Identical requests made while one is in flight share its job
+        job = jobs.submit('download', run_single_download, url, False, quality,
+                          key=f"download {canonicalize_url(url)} {quality or ''}",
+                          url=url, platform=platform, quality=quality, owner=client_id())
+        if job.get('attached'):
+            metrics.inc('downloader_coalesced_total', stage='job', platform=platform)
         
-        return jsonify(result)
+        return jsonify({
+            'status': 'queued',
+            'message': 'Attached to a download already in progress' if job.get('attached') else 'Download queued',
+            'job_id': job['id'],
+            'platform': platform,
+            'coalesced': bool(job.get('attached')),
+            'status_url': f"/jobs/{job['id']}"
+        }), 202
         
     except Exception as e:
         return jsonify({'status': 'error', 'message': f'Server error: {str(e)}'})
 
 @app.route('/bulk-download', methods=['POST'])
 def bulk_download():
-    """Handle bulk download requests"""
+    """Queue a bulk download and return its job id"""
     try:
         data = request.get_json()
         urls = data.get('urls', [])
@@ -353,79 +2974,281 @@ def bulk_download():
         if not urls:
             return jsonify({'status': 'error', 'message': 'URLs list is required'})
         
-        results = []
-        for url in urls:
-            if url.strip():
-                result = downloader.download_content(url.strip())
-                result['url'] = url
-                results.append(result)
+        quality = data.get('quality') or None
+        if quality and quality not in QUALITY_PROFILES:
+            return jsonify({'status': 'error', 'message': f'Unknown quality; choose from {", ".join(QUALITY_PROFILES)}'})
+        
+        urls = [url.strip() for url in urls if url.strip()]
+        job = jobs.submit('bulk-download', run_bulk_download, urls, False, quality,
+                          urls=urls, quality=quality, owner=client_id())
         
         return jsonify({
-            'status': 'success',
-            'message': f'Processed {len(results)} URLs',
-            'results': results
-        })
+            'status': 'queued',
+            'message': f'Queued {len(urls)} URLs',
+            'job_id': job['id'],
+            'status_url': f"/jobs/{job['id']}"
+        }), 202
         
     except Exception as e:
         return jsonify({'status': 'error', 'message': f'Bulk download error: {str(e)}'})
 
+def job_finished_elsewhere(job_id):
+    """True once a job run by another node is done; its progress is not relayed here"""
+    job = jobs.get(job_id)
+    return bool(job and job['state'] in ('finished', 'failed'))
+
+def last_event_id(header, query):
+    """Reconnecting EventSource clients resume after the last event they saw"""
+    try:
+        return int(header or query or 0)
+    except ValueError:
+        return 0
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """Stream a job's progress as server-sent events until it finishes"""
+    if not jobs.get(job_id):
+        return jsonify({'status': 'error', 'message': 'Job not found'}), 404
+
+    def generate(after):
+        while True:
+            events, closed = progress.wait(job_id, after)
+            for event in events:
+                after = event['id']
+                yield sse_message(event)
+            if not events:
+                if closed or job_finished_elsewhere(job_id):
+                    yield SSE_END
+                    return
+                yield SSE_KEEPALIVE
+
+    after = last_event_id(request.headers.get('Last-Event-ID'), request.args.get('after'))
+    response = Response(stream_with_context(generate(after)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/sync', methods=['POST'])
+def sync():
+    """Queue an incremental sync of playlists, channels or profiles"""
+    try:
+        data = request.get_json()
+        urls = data.get('urls') or [data.get('url', '')]
+        urls = [url.strip() for url in urls if url.strip()]
+        
+        if not urls:
+            return jsonify({'status': 'error', 'message': 'URL is required'})
+        
+        job = jobs.submit('sync', run_bulk_download, urls, True, urls=urls, owner=client_id())
+        
+        return jsonify({
+            'status': 'queued',
+            'message': f'Queued sync of {len(urls)} sources',
+            'job_id': job['id'],
+            'status_url': f"/jobs/{job['id']}"
+        }), 202
+        
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': f'Sync error: {str(e)}'})
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Report the state of a queued download job"""
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({'status': 'error', 'message': 'Job not found'}), 404
+    job['status'] = 'success'
+    job['queue_depth'] = jobs.pending()
+    return jsonify(job)
+
+@app.route('/info', methods=['POST'])
+def media_info():
+    """Return metadata for a URL without downloading it"""
+    try:
+        data = request.get_json()
+        url = data.get('url', '').strip()
+        
+        if not url:
+            return jsonify({'status': 'error', 'message': 'URL is required'})
+        
+        result = downloader.get_metadata(url)
+        result['platform'] = downloader.detect_platform(url)
+        return jsonify(result)
+        
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': f'Metadata error: {str(e)}'})
+
+@app.route('/formats', methods=['POST'])
+def formats():
+    """List available formats and per-profile size estimates before downloading"""
+    try:
+        data = request.get_json()
+        url = data.get('url', '').strip()
+        
+        if not url:
+            return jsonify({'status': 'error', 'message': 'URL is required'})
+        
+        result = downloader.list_formats(url)
+        result['platform'] = downloader.detect_platform(url)
+        return jsonify(result)
+        
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': f'Formats error: {str(e)}'})
+
+@app.route('/stream')
+def stream():
+    """Relay media bytes to the client while they download, without touching disk"""
+    try:
+        url = request.args.get('url', '').strip()
+        
+        if not url:
+            return jsonify({'status': 'error', 'message': 'URL is required'}), 400
+        
+        media = downloader.resolve_stream(url)
+        if media['status'] != 'success':
+            return jsonify(media), 422
+        
+        headers = dict(media['headers'])
+        if request.headers.get('Range'):
+            headers['Range'] = request.headers['Range']
+        upstream = downloader.session.get(media['url'], headers=headers, stream=True, timeout=30)
+        if upstream.status_code >= 400:
+            upstream.close()
+            return jsonify({'status': 'error', 'message': f'Upstream returned HTTP {upstream.status_code}'}), 502
+        
+        def generate():
+            try:
+                for chunk in upstream.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                    if chunk:
+                        yield chunk
+            finally:
+                upstream.close()
+        
+        filename = f"{downloader.create_safe_filename(media['title'])}.{media['ext']}"
+        response = Response(stream_with_context(generate()), status=upstream.status_code,
+                            mimetype=upstream.headers.get('Content-Type', 'application/octet-stream'))
+        for header in ('Content-Length', 'Content-Range', 'Accept-Ranges'):
+            if header in upstream.headers:
+                response.headers[header] = upstream.headers[header]
+        response.headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{requests.utils.quote(filename)}"
+        return response
+        
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': f'Stream error: {str(e)}'}), 500
+
 @app.route('/downloads')
 def list_downloads():
+    """List downloads from the catalog with paging, sorting and platform filter"""
     try:
-        items = []
-        if os.path.exists(DOWNLOAD_DIR):
-            for item in os.listdir(DOWNLOAD_DIR):
-                item_path = os.path.join(DOWNLOAD_DIR, item)
-                if os.path.isdir(item_path):
-                    # Look for mp4 files and thumbnail image in folder
-                    mp4_files = [f for f in os.listdir(item_path) if f.lower().endswith('.mp4')]
-                    thumbnail = None
-                    title = None
-
-                    # Try finding thumbnail image in folder
-                    for f in os.listdir(item_path):
-                        if f.lower().startswith('thumbnail') and f.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')):
-                            thumbnail = f'/download-file/{item}/{f}'
-                            break
-
-                    # Use first mp4 file name as title if no explicit title
-                    if mp4_files:
-                        title = os.path.splitext(mp4_files[0])[0]
-
-                    items.append({
-                        'name': item,
-                        'type': 'folder',
-                        'file_count': len(mp4_files),
-                        'thumbnail': thumbnail,
-                        'title': title or item
-                    })
-                elif os.path.isfile(item_path):
-                    items.append({
-                        'name': item,
-                        'type': 'file',
-                        'size': os.path.getsize(item_path),
-                        'thumbnail': None,
-                        'title': os.path.splitext(item)[0]
-                    })
-        return jsonify({'items': items})
+        page = max(1, request.args.get('page', 1, type=int))
+        per_page = min(200, max(1, request.args.get('per_page', 50, type=int)))
+        items, total = catalog.list(
+            page=page,
+            per_page=per_page,
+            sort=request.args.get('sort', 'created'),
+            order=request.args.get('order', 'desc'),
+            platform=request.args.get('platform')
+        )
+        return jsonify({
+            'items': items,
+            'total': total,
+            'page': page,
+            'per_page': per_page
+        })
     except Exception as e:
         return jsonify({'error': str(e)})
 
 
+def serve_download(file_path):
+    """Send a file from DOWNLOAD_DIR with Range/If-Range/ETag support
+
+    When ACCEL_REDIRECT_PREFIX is set the body is left to nginx, otherwise
+    send_file answers conditional and partial requests itself (and uses
+    X-Sendfile or the server's wsgi.file_wrapper when available).
+    """
+    name = storage.item_name(file_path)
+    catalog.touch(name)
+    if ACCEL_REDIRECT_PREFIX:
+        relative_path = os.path.relpath(file_path, DOWNLOAD_DIR).replace(os.sep, '/')
+        response = Response(status=200)
+        response.headers['X-Accel-Redirect'] = ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + requests.utils.quote(relative_path)
+        response.headers['Content-Disposition'] = (
+            f"attachment; filename*=UTF-8''{requests.utils.quote(os.path.basename(file_path))}")
+        # nginx fills in the real type, length and range handling
+        del response.headers['Content-Type']
+        return response
+    # Keep the item from being evicted until the response has been sent
+    storage.pin(name)
+    try:
+        response = send_file(file_path, as_attachment=True, conditional=True, etag=True)
+    except Exception:
+        storage.unpin(name)
+        raise
+    release_when_sent(response, lambda: storage.unpin(name))
+    return response
+
+def release_when_sent(response, callback):
+    """Run callback once the server is done with response
+
+    Werkzeug skips call_on_close for direct-passthrough file bodies, so the
+    file wrapper's own close() is hooked as well (keeping it a file wrapper
+    lets the server still use sendfile).
+    """
+    released = threading.Event()
+    
+    def release():
+        if not released.is_set():
+            released.set()
+            callback()
+    
+    response.call_on_close(release)
+    body = response.response
+    if response.direct_passthrough and hasattr(body, 'close'):
+        close = body.close
+        
+        def close_and_release():
+            try:
+                close()
+            finally:
+                release()
+        body.close = close_and_release
+
 @app.route('/download-file/<path:filename>')
 def download_file(filename):
     """Download a specific file"""
     try:
-        safe_filename = secure_filename(filename)
-        file_path = os.path.join(DOWNLOAD_DIR, safe_filename)
+        # safe_join keeps folder/file paths (as listed by /download-folder)
+        # while refusing anything that escapes DOWNLOAD_DIR
+        file_path = safe_join(DOWNLOAD_DIR, filename)
         
-        if os.path.exists(file_path):
-            return send_file(file_path, as_attachment=True)
-        else:
-            return jsonify({'error': 'File not found'}), 404
+        if file_path and os.path.isfile(file_path):
+            return serve_download(file_path)
+        origin = catalog.locate(filename.split('/', 1)[0])
+        if origin:
+            # Downloaded by another node; its DOWNLOAD_DIR has the file
+            return redirect(origin + request.full_path.rstrip('?'), 307)
+        return jsonify({'error': 'File not found'}), 404
+    except HTTPException:
+        # e.g. 416 for an unsatisfiable Range, with its Content-Range header
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/thumbnails/<name>')
+def thumbnail(name):
+    """Serve a locally generated thumbnail or preview strip"""
+    name = secure_filename(name)
+    if not os.path.isfile(os.path.join(THUMBNAIL_DIR, name)):
+        # Thumbnails are generated next to the download, so another node's
+        # items have theirs in that node's THUMBNAIL_DIR
+        stem = name[:-len('.jpg')] if name.endswith('.jpg') else name
+        candidates = [stem[:-len('-preview')], stem] if stem.endswith('-preview') else [stem]
+        for item in candidates:
+            origin = catalog.locate(item)
+            if origin:
+                return redirect(origin + request.full_path.rstrip('?'), 307)
+    return send_from_directory(THUMBNAIL_DIR, name, max_age=86400)
+
 # @app.route('/download-folder/<foldername>')
 @app.route('/download-folder/<foldername>')
 def download_folder(foldername):
@@ -434,25 +3257,25 @@ def download_folder(foldername):
         folder_path = os.path.join(DOWNLOAD_DIR, safe_foldername)
         
         if os.path.exists(folder_path) and os.path.isdir(folder_path):
-            # Get list of mp4 files
-            mp4_files = [
+            # Get list of media files
+            media_files = [
                 f for f in os.listdir(folder_path)
-                if os.path.isfile(os.path.join(folder_path, f)) and f.lower().endswith('.mp4')
+                if os.path.isfile(os.path.join(folder_path, f)) and f.lower().endswith(MEDIA_EXTENSIONS)
             ]
             
-            if len(mp4_files) == 0:
-                return jsonify({'status': 'error', 'message': 'No MP4 videos found in folder'})
+            if len(media_files) == 0:
+                return jsonify({'status': 'error', 'message': 'No media files found in folder'})
             
-            elif len(mp4_files) == 1:
-                # If only 1 mp4 file, return it directly
-                single_file = mp4_files[0]
+            elif len(media_files) == 1:
+                # If only 1 media file, return it directly
+                single_file = media_files[0]
                 file_path = os.path.join(folder_path, single_file)
-                return send_file(file_path, as_attachment=True)
+                return serve_download(file_path)
             
             else:
                 # If multiple files, return their list with direct download URLs
                 files_info = []
-                for file in mp4_files:
+                for file in media_files:
                     files_info.append({
                         'name': file,
                         'url': f'/download-file/{safe_foldername}/{file}'
@@ -464,11 +3287,21 @@ def download_folder(foldername):
                     'files': files_info
                 })
         else:
+            origin = catalog.locate(safe_foldername)
+            if origin:
+                return redirect(origin + request.full_path.rstrip('?'), 307)
             return jsonify({'status': 'error', 'message': 'Folder not found'}), 404
 
+    except HTTPException:
+        raise
     except Exception as e:
         return jsonify({'status': 'error', 'message': f'Error: {str(e)}'}), 500
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """Expose download pipeline metrics for Prometheus"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/supported-platforms')
 def supported_platforms():
     """List supported platforms"""
@@ -516,14 +3349,189 @@ def remove_readonly(func, path, excinfo):
 def clear_downloads():
     """Clear all downloaded files"""
     try:
+        # Remove item by item so running downloads and transfers are left alone
+        skipped = 0
         if os.path.exists(DOWNLOAD_DIR):
-            shutil.rmtree(DOWNLOAD_DIR, onerror=remove_readonly)
-            os.makedirs(DOWNLOAD_DIR)
+            for entry in os.scandir(DOWNLOAD_DIR):
+                if not storage.remove(entry.name):
+                    skipped += 1
+        resume_index.clear()
+        if skipped:
+            return jsonify({'status': 'success',
+                            'message': f'Downloads cleared; {skipped} items in use were kept'})
         return jsonify({'status': 'success', 'message': 'Downloads cleared successfully'})
     except Exception as e:
         return jsonify({'status': 'error', 'message': f'Error clearing downloads: {str(e)}'})
 
 
+class AsgiBridge:
+    """Serve the Flask app over ASGI without tying a thread to each connection
+
+    Views run in a bounded executor, since they may block in yt-dlp or
+    instaloader. Response bodies (files, /stream relays) are pumped from the
+    event loop, each chunk read in a separate bounded I/O executor, so a slow
+    client holds no thread while it drains. Progress streams wait on the
+    ProgressHub directly and hold no thread at all.
+
+        uvicorn app:asgi_app --host 0.0.0.0 --port 5000
+    """
+
+    JOB_EVENTS = re.compile(r'^/jobs/([^/]+)/events$')
+
+    def __init__(self, wsgi_app, request_workers=ASGI_REQUEST_WORKERS, io_workers=ASGI_IO_WORKERS):
+        self.wsgi_app = wsgi_app
+        self.request_executor = ThreadPoolExecutor(request_workers, thread_name_prefix='asgi-request')
+        self.io_executor = ThreadPoolExecutor(io_workers, thread_name_prefix='asgi-io')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        match = self.JOB_EVENTS.match(scope['path'])
+        if match and scope['method'] == 'GET':
+            # With a shared job store this is a database read; keep it off the loop
+            job = await asyncio.get_running_loop().run_in_executor(self.io_executor, jobs.get, match.group(1))
+            if job:
+                await self.job_events(scope, receive, send, match.group(1))
+                return
+        await self.call_wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.request_executor.shutdown(wait=False)
+                self.io_executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def read_body(self, receive):
+        chunks = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    def watch_disconnect(self, receive):
+        """Return an Event set once the client goes away"""
+        gone = asyncio.Event()
+
+        async def watch():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            gone.set()
+        gone.watcher = asyncio.ensure_future(watch())
+        return gone
+
+    def environ(self, scope, body):
+        server = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+            # send_file reads in large blocks, one I/O executor hop each
+            'wsgi.file_wrapper': lambda file, buffer_size=8192: FileWrapper(file, max(buffer_size, STREAM_CHUNK_SIZE)),
+        }
+        if scope.get('client'):
+            environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = scope['client'][0], str(scope['client'][1])
+        for name, value in scope['headers']:
+            name = name.decode('latin-1').upper().replace('-', '_')
+            key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else 'HTTP_' + name
+            value = value.decode('latin-1')
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+        return environ
+
+    async def call_wsgi(self, scope, receive, send):
+        body = await self.read_body(receive)
+        if body is None:
+            return
+        loop = asyncio.get_running_loop()
+        # Every call for one request shares a context, so Flask's request
+        # context survives streamed bodies hopping between executor threads
+        context = contextvars.Context()
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+            return lambda data: None
+
+        body_iter = await loop.run_in_executor(
+            self.request_executor, context.run, self.wsgi_app, self.environ(scope, body), start_response)
+        gone = self.watch_disconnect(receive)
+        try:
+            await send({'type': 'http.response.start', 'status': started['status'], 'headers': started['headers']})
+            if isinstance(body_iter, list):
+                for chunk in body_iter:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            else:
+                chunks = iter(body_iter)
+                while not gone.is_set():
+                    chunk = await loop.run_in_executor(self.io_executor, context.run, next, chunks, None)
+                    if chunk is None:
+                        break
+                    if chunk:
+                        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            gone.watcher.cancel()
+            if hasattr(body_iter, 'close'):
+                # Closing may unpin storage items or drop upstream connections
+                await loop.run_in_executor(self.io_executor, context.run, body_iter.close)
+
+    async def job_events(self, scope, receive, send, job_id):
+        headers = dict(scope['headers'])
+        query = dict(parse_qsl(scope.get('query_string', b'').decode('latin-1')))
+        after = last_event_id(headers.get(b'last-event-id', b'').decode('latin-1'), query.get('after'))
+        loop = asyncio.get_running_loop()
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ]})
+        gone = self.watch_disconnect(receive)
+        try:
+            while not gone.is_set():
+                waiting = asyncio.ensure_future(progress.wait_async(job_id, after))
+                await asyncio.wait([waiting, gone.watcher], return_when=FIRST_COMPLETED)
+                if not waiting.done():
+                    waiting.cancel()
+                    return
+                events, closed = waiting.result()
+                if events:
+                    after = events[-1]['id']
+                    message = ''.join(sse_message(event) for event in events)
+                elif closed or await loop.run_in_executor(self.io_executor, job_finished_elsewhere, job_id):
+                    await send({'type': 'http.response.body', 'body': SSE_END.encode()})
+                    return
+                else:
+                    message = SSE_KEEPALIVE
+                await send({'type': 'http.response.body', 'body': message.encode(), 'more_body': True})
+        finally:
+            gone.watcher.cancel()
+
+
+asgi_app = AsgiBridge(app)
+
+
 if __name__ == '__main__':
     print("=" * 60)
     print("UNIVERSAL SOCIAL MEDIA DOWNLOADER")
@@ -533,4 +3541,12 @@ if __name__ == '__main__':
     print("Features: Stories, Reels, Posts, Videos, Bulk downloads")
     print("Server running on: http://localhost:5000")
     print("=" * 60)
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    if NODE_ROLE == 'worker':
+        # Download workers only; they take jobs from JOB_STORE
+        print(f"Worker node {NODE_ID} running {len(jobs.workers)} download workers")
+        threading.Event().wait()
+    elif SERVER_MODE == 'asgi':
+        import uvicorn
+        uvicorn.run(asgi_app, host='0.0.0.0', port=5000)
+    else:
+        app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
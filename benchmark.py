@@ -0,0 +1,317 @@
+"""Benchmark the downloader against a local mock media server.
+
+Runs entirely offline: a threaded HTTP server on 127.0.0.1 serves synthetic
+mp4 files (with Range support, optional latency and bandwidth cap) and HTML
+watch pages that yt-dlp's generic extractor resolves to them, and the app is
+pointed at a scratch working directory so DOWNLOAD_DIR and the caches never
+touch a real deployment.
+
+    python benchmark.py --output bench.json
+    python benchmark.py --levels 1,4,8 --delay 0.2 --rate 2097152
+
+Results are written as JSON so they can be compared between builds.
+"""
+import argparse
+import collections
+import contextlib
+import json
+import os
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+BLOCK = bytes(range(256)) * 256  # 64 KiB of deterministic filler
+
+# Minimal video page: the generic extractor picks up the <video> tag, so
+# every download of a /watch URL goes through a real extraction step
+WATCH_PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<title>{name}</title>
+<meta property="og:title" content="{name}">
+<meta property="og:type" content="video.other">
+<meta property="og:video" content="/media/{name}.mp4">
+</head>
+<body><video src="/media/{name}.mp4" controls></video></body>
+</html>
+"""
+
+
+class MockMediaHandler(BaseHTTPRequestHandler):
+    """Serve /media/<name>.mp4 as a synthetic video of server.media_size bytes
+
+    /watch/<name> is an HTML page embedding that video. server.requests
+    counts GETs per kind ('page', 'media') so benchmarks can tell how much
+    work reached upstream.
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.serve(body=False)
+
+    def do_GET(self):
+        self.serve(body=True)
+
+    def serve(self, body):
+        page = re.match(r'^/watch/([\w.-]+)$', self.path.split('?')[0])
+        if page:
+            self.serve_page(page.group(1), body)
+            return
+        if not re.match(r'^/media/[\w.-]+\.mp4$', self.path.split('?')[0]):
+            self.send_error(404)
+            return
+        if body:
+            self.server.requests['media'] += 1
+
+        size = self.server.media_size
+        start, end = 0, size - 1
+        match = re.match(r'bytes=(\d*)-(\d*)', self.headers.get('Range', ''))
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = int(match.group(2)) if match.group(2) else size - 1
+            else:
+                start = size - int(match.group(2))
+            end = min(end, size - 1)
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        if not body:
+            return
+
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        remaining = end - start + 1
+        offset = start % len(BLOCK)
+        started = time.perf_counter()
+        sent = 0
+        while remaining > 0:
+            chunk = BLOCK[offset:offset + remaining]
+            offset = 0
+            try:
+                self.wfile.write(chunk)
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            remaining -= len(chunk)
+            sent += len(chunk)
+            if self.server.rate:
+                # Sleep until the bandwidth cap allows the bytes sent so far
+                ahead = sent / self.server.rate - (time.perf_counter() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+
+    def serve_page(self, name, body):
+        page = WATCH_PAGE.format(name=name).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(page)))
+        self.end_headers()
+        if body:
+            self.server.requests['page'] += 1
+            if self.server.delay:
+                time.sleep(self.server.delay)
+            self.wfile.write(page)
+
+
+def start_mock_server(media_size, delay=0.0, rate=0):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MockMediaHandler)
+    server.daemon_threads = True
+    server.media_size = media_size
+    server.delay = delay
+    server.rate = rate
+    server.requests = collections.Counter()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        'count': len(samples),
+        'mean': statistics.mean(samples),
+        'p50': samples[len(samples) // 2],
+        'p95': samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        'max': samples[-1],
+    }
+
+
+def bench_single(app, base_url, runs):
+    """Latency of one download_content call, end to end"""
+    timings = []
+    for i in range(runs):
+        url = f'{base_url}/media/single-{i}.mp4'
+        started = time.perf_counter()
+        result = app.downloader.download_content(url)
+        timings.append(time.perf_counter() - started)
+        if result.get('status') != 'success':
+            raise RuntimeError(f'Download failed: {result.get("message")}')
+    return summarize(timings)
+
+
+def bench_bulk(app, base_url, levels, batch_size):
+    """Throughput of a bulk job at several concurrency levels"""
+    results = []
+    for level in levels:
+        app.limiter.total = level
+        app.limiter.per_platform = dict(app.limiter.per_platform, unknown=level)
+        urls = [f'{base_url}/media/bulk-{level}-{i}.mp4' for i in range(batch_size)]
+        started = time.perf_counter()
+        outcome = app.run_bulk_download(urls)
+        elapsed = time.perf_counter() - started
+        failures = sum(1 for r in outcome['results'] if r.get('status') != 'success')
+        results.append({
+            'concurrency': level,
+            'urls': batch_size,
+            'seconds': elapsed,
+            'urls_per_second': batch_size / elapsed,
+            'failures': failures,
+        })
+    return results
+
+
+def bench_repeat(app, server, base_url, repeats):
+    """The same watch page downloaded again and again
+
+    The first run extracts the page and fetches the media; later runs should
+    be answered by the metadata cache and the dedup index, so they make no
+    page or media requests upstream.
+    """
+    url = f'{base_url}/watch/repeat'
+    runs = []
+    for i in range(repeats + 1):
+        before = collections.Counter(server.requests)
+        started = time.perf_counter()
+        result = app.downloader.download_content(url)
+        elapsed = time.perf_counter() - started
+        if result.get('status') != 'success':
+            raise RuntimeError(f'Download failed: {result.get("message")}')
+        runs.append({
+            'seconds': elapsed,
+            'page_requests': server.requests['page'] - before['page'],
+            'media_requests': server.requests['media'] - before['media'],
+        })
+    repeated = runs[1:]
+    return {
+        'first': runs[0],
+        'repeat': summarize([run['seconds'] for run in repeated]) if repeated else None,
+        'repeat_page_requests': sum(run['page_requests'] for run in repeated),
+        'repeat_media_requests': sum(run['media_requests'] for run in repeated),
+    }
+
+
+def bench_listing(app, client, folder_counts, repeats=5):
+    """Time /downloads as the number of catalogued folders grows"""
+    results = []
+    existing = app.catalog.count()
+    for count in folder_counts:
+        for i in range(existing, count):
+            name = f'unknown_bench_{i:07d}'
+            os.makedirs(os.path.join(app.DOWNLOAD_DIR, name), exist_ok=True)
+            app.catalog.record(name, 'unknown', name)
+        existing = max(existing, count)
+        timings = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            response = client.get('/downloads?per_page=50')
+            timings.append(time.perf_counter() - started)
+            assert response.status_code == 200
+        results.append({'folders': existing, **summarize(timings)})
+    return results
+
+
+def bench_serving(app, client, size, repeats=3):
+    """Throughput of /download-file for one large file"""
+    folder = os.path.join(app.DOWNLOAD_DIR, 'unknown_serving')
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, 'large.mp4')
+    with open(path, 'wb') as f:
+        for _ in range(size // len(BLOCK)):
+            f.write(BLOCK)
+    actual_size = os.path.getsize(path)
+
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        response = client.get('/download-file/unknown_serving/large.mp4')
+        received = sum(len(chunk) for chunk in response.response)
+        response.close()
+        timings.append(time.perf_counter() - started)
+        assert received == actual_size
+    stats = summarize(timings)
+    stats['bytes'] = actual_size
+    stats['bytes_per_second'] = actual_size / stats['p50']
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', help='write JSON results here instead of stdout')
+    parser.add_argument('--media-size', type=int, default=2 * 1024 * 1024, help='bytes per mock media file')
+    parser.add_argument('--delay', type=float, default=0.05, help='mock server latency per response (s)')
+    parser.add_argument('--rate', type=int, default=0, help='mock server bandwidth cap per response (bytes/s)')
+    parser.add_argument('--single-runs', type=int, default=5)
+    parser.add_argument('--repeat-runs', type=int, default=5, help='downloads of an already fetched page')
+    parser.add_argument('--levels', default='1,2,4,8', help='bulk concurrency levels')
+    parser.add_argument('--batch-size', type=int, default=16, help='URLs per bulk job')
+    parser.add_argument('--folders', default='100,1000,10000', help='folder counts for the listing benchmark')
+    parser.add_argument('--serve-size', type=int, default=64 * 1024 * 1024, help='bytes for the file-serving benchmark')
+    parser.add_argument('--keep', action='store_true', help='keep the scratch directory')
+    args = parser.parse_args()
+
+    output_path = os.path.abspath(args.output) if args.output else None
+    workdir = tempfile.mkdtemp(prefix='downloader-bench-')
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    os.chdir(workdir)
+    os.environ.setdefault('CACHE_DIR', os.path.join(workdir, 'cache'))
+    sys.path.insert(0, repo_dir)
+
+    server = start_mock_server(args.media_size, args.delay, args.rate)
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+    report = {
+        'started': time.time(),
+        'config': vars(args),
+    }
+
+    try:
+        # yt-dlp reports progress on stdout; keep stdout for the JSON report
+        with contextlib.redirect_stdout(sys.stderr):
+            started = time.perf_counter()
+            import app
+            report['import_seconds'] = time.perf_counter() - started
+            client = app.app.test_client()
+
+            report['single_download'] = bench_single(app, base_url, args.single_runs)
+            report['repeat_download'] = bench_repeat(app, server, base_url, args.repeat_runs)
+            report['bulk_download'] = bench_bulk(
+                app, base_url, [int(level) for level in args.levels.split(',')], args.batch_size)
+            report['listing'] = bench_listing(
+                app, client, [int(count) for count in args.folders.split(',')])
+            report['file_serving'] = bench_serving(app, client, args.serve_size)
+    finally:
+        server.shutdown()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if output_path:
+        with open(output_path, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
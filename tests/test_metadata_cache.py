@@ -0,0 +1,101 @@
+"""Cached extractor results must not carry an earlier run's format selection."""
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import benchmark  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def app():
+    """Import the app inside a scratch working directory"""
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix='downloader-test-')
+    os.chdir(workdir)
+    os.environ['CACHE_DIR'] = os.path.join(workdir, 'cache')
+    try:
+        import app as module
+        yield module
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture(scope='module')
+def server():
+    server = benchmark.start_mock_server(64 * 1024)
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def mock_extractor(app, server, monkeypatch):
+    """A YouTube-like extractor: separate video and audio, plus one progressive format"""
+    import yt_dlp
+    from yt_dlp.extractor.common import InfoExtractor
+
+    base = f'http://127.0.0.1:{server.server_address[1]}'
+
+    class MockIE(InfoExtractor):
+        IE_NAME = 'mock'
+        _VALID_URL = r'https?://127\.0\.0\.1:\d+/video/(?P<id>[\w-]+)'
+
+        def _real_extract(self, url):
+            video_id = self._match_id(url)
+            return {
+                'id': video_id,
+                'title': video_id,
+                'formats': [
+                    {'format_id': '18', 'url': f'{base}/media/{video_id}-18.mp4', 'ext': 'mp4',
+                     'vcodec': 'avc1', 'acodec': 'mp4a', 'height': 360, 'tbr': 500},
+                    {'format_id': '137', 'url': f'{base}/media/{video_id}-137.mp4', 'ext': 'mp4',
+                     'vcodec': 'avc1', 'acodec': 'none', 'height': 1080, 'tbr': 4000},
+                    {'format_id': '140', 'url': f'{base}/media/{video_id}-140.mp4', 'ext': 'm4a',
+                     'vcodec': 'none', 'acodec': 'mp4a', 'tbr': 128},
+                ],
+            }
+
+    class MockYoutubeDL(yt_dlp.YoutubeDL):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.add_info_extractor(MockIE())
+            # Ahead of the generic extractor, which would otherwise claim the URL
+            self._ies = {'Mock': self._ies.pop('Mock'), **self._ies}
+
+    monkeypatch.setattr(yt_dlp, 'YoutubeDL', MockYoutubeDL)
+    app.extractor_pool.idle.clear()
+    yield base
+    app.extractor_pool.idle.clear()
+
+
+def test_quality_and_stream_after_merged_download(app, server, mock_extractor):
+    url = f'{mock_extractor}/video/clip'
+    # Resolve 137+140 the way a merged download does, minus the ffmpeg merge
+    options = {'quiet': True, 'skip_download': True, **app.QUALITY_PROFILES['1080p']}
+    with app.extractor_pool.youtube_dl('generic', options) as ydl:
+        merged = app.downloader.extract_info(ydl, url, download=False)
+    assert merged['format_id'] == '137+140'
+    assert app.metadata_cache.get(url) is not None
+
+    media = app.downloader.resolve_stream(url)
+    assert media['status'] == 'success'
+    assert media['url'].endswith('/media/clip-18.mp4')
+
+    response = app.app.test_client().get('/stream', query_string={'url': url})
+    assert response.status_code == 200
+    assert len(response.get_data()) == server.media_size
+
+    # Replayed from the cache, not re-extracted after a failed replay
+    misses = ('downloader_metadata_cache_total', (('result', 'miss'),))
+    missed = app.metrics.values.get(misses, 0)
+    server.requests.clear()
+    result = app.downloader.download_content(url, quality='original')
+    assert result['status'] == 'success'
+    assert app.metrics.values.get(misses, 0) == missed
+    assert server.requests['media'] == 1
+    folder = os.path.join(app.DOWNLOAD_DIR, result['folder'])
+    assert [name for name in os.listdir(folder) if name.endswith('.mp4')]